@@ -0,0 +1,152 @@
+"""合成 EPUB 生成器：章节数、每章段落数、段落长度分布均可配置
+
+python -m bench.epub_gen out.epub --chapters 20 --paragraphs 300 --words 40 --dist lognormal
+"""
+
+import argparse
+import math
+import os
+import random
+import zipfile
+
+WORDS = (
+    "the of and to in is that it for as with was on be by this are from or "
+    "an at which but not have has were all their can one more when will there "
+    "memory thread kernel buffer socket process cache compiler function pointer "
+    "request latency server client network packet queue lock scheduler page"
+).split()
+
+CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+
+def paragraph_lengths(rng, count, words, dist):
+    """按分布生成每段的单词数"""
+    for _ in range(count):
+        match dist:
+            case "fixed":
+                n = words
+            case "uniform":
+                n = rng.randint(1, words * 2)
+            case "dialogue":
+                # 大量短对话夹杂少量长段落
+                n = rng.randint(2, 8) if rng.random() < 0.8 else rng.randint(words, words * 4)
+            case _:
+                sigma = 0.8
+                n = int(rng.lognormvariate(math.log(words) - sigma**2 / 2, sigma))
+        yield max(2, n)
+
+
+def make_paragraph(rng, n):
+    words = [rng.choice(WORDS) for _ in range(n)]
+    words[0] = words[0].capitalize()
+    if n > 6:
+        i = rng.randrange(1, n - 1)
+        words[i] = f"<b>{words[i]}</b>"
+    if n > 12:
+        i = rng.randrange(1, n - 1)
+        words[i] = f"<code>{words[i]}()</code>"
+    return f"<p>{' '.join(words)}.</p>"
+
+
+def make_chapter(rng, idx, paragraphs, words, dist, code_ratio):
+    body = [f"<h1>Chapter {idx + 1}</h1>"]
+    for n in paragraph_lengths(rng, paragraphs, words, dist):
+        if rng.random() < code_ratio:
+            body.append(f'<p class="programlisting">$ make -j{rng.randint(1, 16)} all</p>')
+        else:
+            body.append(make_paragraph(rng, n))
+
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml">\n'
+        f"<head><title>Chapter {idx + 1}</title></head>\n<body>\n"
+        + "\n".join(body)
+        + "\n</body>\n</html>\n"
+    )
+
+
+def generate(
+    path,
+    chapters=10,
+    paragraphs=200,
+    words=40,
+    dist="lognormal",
+    images=0,
+    image_kb=200,
+    code_ratio=0.05,
+    seed=42,
+):
+    """生成合成 EPUB，返回总段落数"""
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        zf.writestr("META-INF/container.xml", CONTAINER, compress_type=zipfile.ZIP_DEFLATED)
+
+        manifest = ['<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>']
+        spine = []
+        nav = []
+        for i in range(chapters):
+            name = f"ch{i + 1:03}.xhtml"
+            manifest.append(f'<item id="ch{i}" href="{name}" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="ch{i}"/>')
+            nav.append(
+                f'<navPoint id="np{i}" playOrder="{i + 1}"><navLabel><text>Chapter {i + 1}</text>'
+                f'</navLabel><content src="{name}"/></navPoint>'
+            )
+            zf.writestr(
+                f"OEBPS/{name}",
+                make_chapter(rng, i, paragraphs, words, dist, code_ratio),
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+
+        for i in range(images):
+            name = f"images/img{i:03}.png"
+            manifest.append(f'<item id="img{i}" href="{name}" media-type="image/png"/>')
+            zf.writestr(f"OEBPS/{name}", rng.randbytes(image_kb * 1024), compress_type=zipfile.ZIP_DEFLATED)
+
+        zf.writestr(
+            "OEBPS/content.opf",
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="2.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:identifier id="id">urn:bench:{seed}</dc:identifier><dc:title>Bench</dc:title>'
+            "<dc:language>en</dc:language></metadata>"
+            f"<manifest>{''.join(manifest)}</manifest>"
+            f'<spine toc="ncx">{"".join(spine)}</spine></package>',
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+        zf.writestr(
+            "OEBPS/toc.ncx",
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+            f"<navMap>{''.join(nav)}</navMap></ncx>",
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+
+    return chapters * paragraphs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成合成 EPUB")
+    parser.add_argument("output")
+    parser.add_argument("--chapters", type=int, default=10)
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--words", type=int, default=40, help="段落平均单词数")
+    parser.add_argument("--dist", default="lognormal", choices=["fixed", "uniform", "lognormal", "dialogue"])
+    parser.add_argument("--images", type=int, default=0)
+    parser.add_argument("--image-kb", type=int, default=200)
+    parser.add_argument("--code-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    a = parser.parse_args()
+    total = generate(
+        a.output, a.chapters, a.paragraphs, a.words, a.dist, a.images, a.image_kb, a.code_ratio, a.seed
+    )
+    print(f"{a.output}: {a.chapters} 章, {total} 段")
@@ -0,0 +1,168 @@
+"""本地 OpenAI 兼容的模拟服务：可配置延迟分布、429 注入与 token 统计
+
+python -m bench.mock_server --port 8000 --latency lognormal --mean 0.8 --rate-429 0.02
+然后在 .env 中设置 API_URL=http://127.0.0.1:8000/v1
+"""
+
+from tools.httpd import serve
+from translators.base_api import estimate_tokens
+
+import argparse
+import asyncio
+import collections
+import math
+import random
+import time
+import uuid
+
+
+class MockLLM:
+    def __init__(
+        self,
+        latency="lognormal",
+        mean=0.5,
+        sigma=0.5,
+        per_token=0.0,
+        rate_429=0.0,
+        retry_after=1.0,
+        rpm=0,
+        seed=0,
+    ):
+        self.latency = latency
+        self.mean = mean
+        self.sigma = sigma
+        self.per_token = per_token
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rpm = rpm
+        self.rng = random.Random(seed)
+        self.window = collections.deque()
+        self.reset()
+
+    def reset(self):
+        self.stats = {
+            "requests": 0,
+            "ok": 0,
+            "throttled": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+        }
+
+    def sample_latency(self):
+        match self.latency:
+            case "fixed":
+                return self.mean
+            case "uniform":
+                return self.rng.uniform(0, 2 * self.mean)
+            case "exponential":
+                return self.rng.expovariate(1 / self.mean) if self.mean > 0 else 0
+            case _:
+                if self.mean <= 0:
+                    return 0
+                mu = math.log(self.mean) - self.sigma**2 / 2
+                return self.rng.lognormvariate(mu, self.sigma)
+
+    def _over_rpm(self):
+        if self.rpm <= 0:
+            return False
+        now = time.monotonic()
+        while self.window and now - self.window[0] > 60:
+            self.window.popleft()
+        if len(self.window) >= self.rpm:
+            return True
+        self.window.append(now)
+        return False
+
+    def _remaining(self):
+        return max(0, self.rpm - len(self.window)) if self.rpm > 0 else 10_000
+
+    async def handle(self, request):
+        if request.method == "GET" and request.path.rstrip("/") == "/stats":
+            return 200, {}, self.stats
+        if request.method == "POST" and request.path.rstrip("/") == "/reset":
+            self.reset()
+            return 200, {}, self.stats
+        if request.method != "POST" or not request.path.endswith("/chat/completions"):
+            return 404, {}, {"error": {"message": "not found"}}
+
+        body = request.json()
+        self.stats["requests"] += 1
+
+        if self._over_rpm() or self.rng.random() < self.rate_429:
+            self.stats["throttled"] += 1
+            return (
+                429,
+                {"retry-after": f"{self.retry_after:g}", "x-ratelimit-remaining-requests": "0"},
+                {"error": {"message": "rate limited", "type": "rate_limit_error"}},
+            )
+
+        messages = body.get("messages", [])
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        # 原样返回用户内容作为“译文”，分段标记因此能被正确拆分
+        content = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        completion_tokens = estimate_tokens(content)
+
+        self.stats["in_flight"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            await asyncio.sleep(self.sample_latency() + self.per_token * completion_tokens)
+        finally:
+            self.stats["in_flight"] -= 1
+
+        self.stats["ok"] += 1
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["completion_tokens"] += completion_tokens
+        return (
+            200,
+            {"x-ratelimit-remaining-requests": str(self._remaining())},
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model") or "mock",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                        "logprobs": None,
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+    async def start(self, host="127.0.0.1", port=0):
+        """启动服务，返回 (server, base_url)"""
+        server = await serve(self.handle, host, port)
+        port = server.sockets[0].getsockname()[1]
+        return server, f"http://{host}:{port}/v1"
+
+
+async def _main(a):
+    mock = MockLLM(a.latency, a.mean, a.sigma, a.per_token, a.rate_429, a.retry_after, a.rpm, a.seed)
+    server, url = await mock.start(a.host, a.port)
+    print(f"mock LLM listening on {url}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="lognormal", choices=["fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--mean", type=float, default=0.5, help="平均延迟（秒）")
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--per-token", type=float, default=0.0, help="每个输出 token 追加的延迟（秒）")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="随机返回 429 的概率")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--rpm", type=int, default=0, help="每分钟请求上限，0 表示不限")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(_main(parser.parse_args()))
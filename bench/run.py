@@ -0,0 +1,246 @@
+"""离线基准测试：合成 EPUB + 本地模拟 LLM，输出可对比的 JSON
+
+python -m bench.run                              # 运行全部场景（每个场景一个子进程）
+python -m bench.run --scenario mock-batch        # 只运行一个场景
+python -m bench.run --output new.json
+python -m bench.run --compare old.json new.json  # 对比两次结果
+"""
+
+import os
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+from bench.epub_gen import generate
+from bench.mock_server import MockLLM
+from tools.batch import BatchRunner
+from tools.checkpoint import Checkpoint
+from tools.epub_utils import EpubTool
+from tools.journal import ProgressJournal
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BOOK = dict(chapters=6, paragraphs=100, words=40, dist="lognormal")
+
+SCENARIOS = {
+    "foo": dict(book=BOOK, ai="foo", tasks=8),
+    "mock-baseline": dict(book=BOOK, ai="mock", tasks=8, mock=dict(mean=0.2)),
+    "mock-batch": dict(book=BOOK, ai="mock", tasks=8, batch_tokens=1500, mock=dict(mean=0.2)),
+    "mock-dialogue": dict(
+        book=dict(BOOK, dist="dialogue", words=60), ai="mock", tasks=8, batch_tokens=1500, mock=dict(mean=0.2)
+    ),
+    "mock-429": dict(book=BOOK, ai="mock", tasks=8, mock=dict(mean=0.2, rate_429=0.05, retry_after=0.5)),
+    "mock-slow-tail": dict(book=BOOK, ai="mock", tasks=8, mock=dict(latency="lognormal", mean=0.3, sigma=1.2)),
+    "mock-pipeline": dict(
+        book=BOOK, ai="mock", tasks=8, window=3, mock=dict(latency="lognormal", mean=0.3, sigma=1.2)
+    ),
+    "lazy": dict(book=BOOK, ai="foo", tasks=8, lazy=True),
+    "package-images": dict(
+        book=dict(chapters=20, paragraphs=20, words=30, images=60, image_kb=512), ai="foo", tasks=8
+    ),
+}
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.phases = {p: 0.0 for p in ("extract", "parse", "translate", "apply", "package")}
+
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+
+
+class TimedCheckpoint(Checkpoint):
+    """统计解析与回填耗时的 Checkpoint"""
+
+    timer = None
+
+    async def load_chapter_process(self, file_path):
+        start = time.perf_counter()
+        try:
+            return await super().load_chapter_process(file_path)
+        finally:
+            self.timer.add("parse", time.perf_counter() - start)
+
+    async def apply_progress_to_file(self, file_path):
+        start = time.perf_counter()
+        parse_before = self.timer.phases["parse"]
+        try:
+            return await super().apply_progress_to_file(file_path)
+        finally:
+            nested = self.timer.phases["parse"] - parse_before
+            self.timer.add("apply", time.perf_counter() - start - nested)
+
+
+def make_translator(config, base_url):
+    if config["ai"] == "foo":
+        from translators.base_api import FooAITranslator
+
+        return FooAITranslator()
+
+    # 以 "bench" 配置名接入模拟服务，与真实服务走同一条连接池/限流路径
+    os.environ["BENCH_API_KEY"] = "bench"
+    os.environ["BENCH_API_URL"] = base_url
+    os.environ["BENCH_MODEL"] = "mock"
+    os.environ["BENCH_API_CONCURRENCY"] = str(config.get("concurrency", 64))
+
+    from translators.base_api import prompt
+    from translators.openai_style import OpenAICompatibleTranslator
+
+    return OpenAICompatibleTranslator(prompt, "bench")
+
+
+async def run_scenario(name, config):
+    work_dir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    epub_path = os.path.join(work_dir, "book.epub")
+    paragraphs = generate(epub_path, **config["book"])
+    timer = PhaseTimer()
+
+    mock = MockLLM(**config.get("mock", {}))
+    server, base_url = await mock.start()
+    translator = make_translator(config, base_url)
+    try:
+        journal = ProgressJournal()
+
+        wall_start = time.perf_counter()
+        start = time.perf_counter()
+        TimedCheckpoint.timer = timer
+        cp = TimedCheckpoint(
+            epub_path,
+            False,
+            [translator],
+            journal,
+            batch_tokens=config.get("batch_tokens", 0),
+            lazy=config.get("lazy", False),
+        )
+        timer.add("extract", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        if "window" in config:
+            # 流水线模式：解析/回填与翻译重叠，打包在 BatchRunner 内完成
+            await BatchRunner([cp], translator, config["tasks"], window=config["window"]).run()
+        else:
+            for file_path in cp.get_next_file():
+                await cp.translate_epub(file_path, config["tasks"])
+        await journal.close()
+        loop_time = time.perf_counter() - start
+        timer.add("translate", loop_time - timer.phases["parse"] - timer.phases["apply"])
+
+        if "window" not in config:
+            start = time.perf_counter()
+            EpubTool.package_epub(cp)
+            timer.add("package", time.perf_counter() - start)
+        wall = time.perf_counter() - wall_start
+    finally:
+        # 先关闭客户端的 keep-alive 连接，否则 wait_closed 会一直等待
+        if hasattr(translator, "client"):
+            from translators.http_pool import close_http_client
+
+            await close_http_client()
+        server.close()
+        await server.wait_closed()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    requests = mock.stats["requests"] if config["ai"] != "foo" else paragraphs
+    return {
+        "scenario": name,
+        "config": config,
+        "paragraphs": paragraphs,
+        "requests": requests,
+        "wall_s": round(wall, 3),
+        "paragraphs_per_s": round(paragraphs / loop_time, 2) if loop_time else None,
+        "requests_per_s": round(requests / loop_time, 2) if loop_time else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "phases_s": {k: round(v, 3) for k, v in timer.phases.items()},
+        "mock": mock.stats if config["ai"] != "foo" else None,
+    }
+
+
+def run_all(names):
+    """每个场景在独立子进程中运行，保证峰值内存互不影响"""
+    results = []
+    for name in names:
+        with tempfile.NamedTemporaryFile("r", suffix=".json") as out:
+            subprocess.run(
+                [sys.executable, "-m", "bench.run", "--child", name, "--output", out.name],
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            results.extend(json.load(out))
+    return results
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = {r["scenario"]: r for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = {r["scenario"]: r for r in json.load(f)["results"]}
+
+    metrics = ["wall_s", "paragraphs_per_s", "requests_per_s", "peak_rss_mb"]
+    for name in sorted(old.keys() & new.keys()):
+        print(f"[{name}]")
+        rows = [(m, old[name][m], new[name][m]) for m in metrics]
+        rows += [
+            (f"phase.{p}", old[name]["phases_s"][p], new[name]["phases_s"].get(p))
+            for p in old[name]["phases_s"]
+        ]
+        for metric, a, b in rows:
+            if a is None or b is None:
+                continue
+            delta = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+            print(f"  {metric:<20}{a:>12}{b:>12}  {delta}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPUB 翻译离线基准测试")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="可重复指定")
+    parser.add_argument("--output", help="结果 JSON 路径（默认输出到标准输出）")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--list", action="store_true")
+    parser.add_argument("--child", choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.list:
+        for name, config in SCENARIOS.items():
+            print(f"{name}: {json.dumps(config, ensure_ascii=False)}")
+        return
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger("httpx").disabled = True
+
+    if args.child:
+        # 子进程：只跑一个场景，结果写入 --output
+        results = [asyncio.run(run_scenario(args.child, SCENARIOS[args.child]))]
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        return
+
+    names = args.scenario or list(SCENARIOS)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": run_all(names),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,29 @@
+from tools.batch import BatchRunner, collect_books
+from tools.bulk import BulkRunner
 from tools.checkpoint import Checkpoint
-from translators.base_translator import get_translator
+from tools.edition import EditionStore
+from tools.estimate import estimate_books
+from tools.journal import ProgressJournal
+from tools.lowmem import MemoryGuard, peak_rss_mb
+from tools.metrics import JsonlExporter, serve_metrics
+from tools.prefilter import DEFAULT_CLASSES, Prefilter
+from tools.segment import ParagraphSplitter
+from tools.service import TranslationService
+from translators.base_api import prompt
+from translators.base_translator import find_layer, get_translator
+from translators.batch_api import BatchAPITranslator, LocalBatchEndpoint
+from translators.hedge import HedgedTranslator
+from translators.http_pool import close_http_client
+from translators.profiles import has_profile, profile_prefix
+from translators.memory import TranslationMemory
 from tools.epub_utils import EpubTool
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
 
 import logging
+import cProfile
 import os, time
+import signal
 import asyncio
 import argparse
 
@@ -30,21 +49,21 @@ parser.add_argument(
     "--file",
     type=str,
     required=True,
-    help="要处理的 EPUB 文件路径",
+    help="要处理的 EPUB 文件路径（batch 模式下为目录或书单文件，serve 模式下为工作目录）",
 )
 
 parser.add_argument(
     "--mode",
     type=str,
     default="extract",
-    help="要处理的 EPUB 文件路径",
+    help="运行模式: extract / trans / package / batch / estimate / bulk（批处理接口，离线大批量）/ serve（常驻服务）",
 )
 
 parser.add_argument(
     "--ai",
     type=str,
     default="foo",
-    help="使用的ai",
+    help="使用的ai，多个服务用逗号分隔并可带权重，如 openai:2,free",
 )
 
 parser.add_argument(
@@ -57,7 +76,189 @@ parser.add_argument(
 parser.add_argument(
     "--force",
     action="store_true",
-    help="强制清除上次的缓存",
+    help="强制清除上次的缓存（内容未变的段落仍从跨版本译文库补齐，用 --no-edition 关闭）",
+)
+
+parser.add_argument(
+    "--fsync",
+    action="store_true",
+    help="进度日志每次批量提交后执行 fsync（更安全，稍慢）",
+)
+
+parser.add_argument(
+    "--batch-tokens",
+    type=int,
+    default=0,
+    help="把连续段落打包成一次请求的 token 预算，0 表示逐段请求 (默认: 0)",
+)
+
+parser.add_argument(
+    "--tm",
+    type=str,
+    default=None,
+    help="翻译记忆数据库路径 (默认: <书所在目录>/tmp/translation_memory.sqlite3)",
+)
+
+parser.add_argument(
+    "--no-tm",
+    action="store_true",
+    help="不使用翻译记忆",
+)
+
+parser.add_argument(
+    "--edition-store",
+    type=str,
+    default=None,
+    help="跨版本译文库路径，新版本的书只翻译新增/改动的段落 (默认: <书所在目录>/tmp/editions.sqlite3)",
+)
+
+parser.add_argument(
+    "--no-edition",
+    action="store_true",
+    help="不使用跨版本译文库",
+)
+
+parser.add_argument(
+    "--book-id",
+    type=str,
+    default=None,
+    help="指定书的标识（默认取 OPF 的 dc:identifier），新旧版本标识不同时用它关联",
+)
+
+parser.add_argument(
+    "--no-extract",
+    action="store_true",
+    help="不解压 EPUB，章节按需从原书读取，只保存改动过的章节",
+)
+
+parser.add_argument(
+    "--hedge",
+    type=float,
+    default=0,
+    help="请求耗时超过历史延迟的该分位（如 0.95）时发送对冲请求，0 表示关闭 (默认: 0)",
+)
+
+parser.add_argument(
+    "--hedge-budget",
+    type=float,
+    default=0.05,
+    help="对冲请求占主请求的比例上限 (默认: 0.05)",
+)
+
+parser.add_argument(
+    "--window",
+    type=int,
+    default=2,
+    help="同时在途的章节数：下一章在上一章收尾/回填时即开始翻译，1 表示逐章处理 (默认: 2)",
+)
+
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=0,
+    help="章节解析/回填使用的进程数，0 表示在主进程中完成 (默认: 0)",
+)
+
+parser.add_argument(
+    "--listen",
+    type=str,
+    default="127.0.0.1:8765",
+    help="serve 模式的监听地址 (默认: 127.0.0.1:8765)",
+)
+
+parser.add_argument(
+    "--socket",
+    type=str,
+    default=None,
+    help="serve 模式改为监听该 Unix socket",
+)
+
+parser.add_argument(
+    "--jobs",
+    type=int,
+    default=1,
+    help="serve 模式下同时翻译的书籍数，共享 --tasks 之外的同一组连接与限流状态 (默认: 1)",
+)
+
+parser.add_argument(
+    "--bulk-local",
+    type=str,
+    default=None,
+    help="bulk 模式使用该目录下的本地批处理替身代替 OpenAI Batch API（--ai foo 时默认为 tmp/batch_local）",
+)
+
+parser.add_argument(
+    "--poll-interval",
+    type=float,
+    default=60,
+    help="bulk 模式查询批处理任务状态的间隔（秒）(默认: 60)",
+)
+
+parser.add_argument(
+    "--split-tokens",
+    type=int,
+    default=0,
+    help="超过该 token 数的段落拆成多个请求并发翻译，0 表示按实测输出速度自动确定，-1 表示不拆分 (默认: 0)",
+)
+
+parser.add_argument(
+    "--no-publish",
+    action="store_true",
+    help="不在每章完成时更新 bi_<书名>.epub，只在全书完成后打包",
+)
+
+parser.add_argument(
+    "--low-memory",
+    action="store_true",
+    help="低内存模式：段落只记录字节偏移，原文按需读取，回填时流式拼接（适合超大章节，忽略 --workers）",
+)
+
+parser.add_argument(
+    "--max-rss",
+    type=int,
+    default=0,
+    help="内存上限 (MB)：超过时暂停预读新章节，直到在途章节提交，0 表示不限制 (默认: 0)",
+)
+
+parser.add_argument(
+    "--no-prefilter",
+    action="store_true",
+    help="关闭本地预过滤（代码、纯数字、已是中文等段落也发送请求）",
+)
+
+parser.add_argument(
+    "--skip-class",
+    action="append",
+    default=None,
+    help=f"预过滤跳过带有该 CSS 类的段落，可重复指定 (默认: {','.join(DEFAULT_CLASSES)})",
+)
+
+parser.add_argument(
+    "--skip-regex",
+    action="append",
+    default=[],
+    help="预过滤跳过纯文本匹配该正则的段落，可重复指定",
+)
+
+parser.add_argument(
+    "--metrics-port",
+    type=int,
+    default=None,
+    help="在该端口提供 Prometheus 指标 (http://127.0.0.1:PORT/metrics)",
+)
+
+parser.add_argument(
+    "--metrics-file",
+    type=str,
+    default=None,
+    help="定期把指标快照追加到该 JSONL 文件",
+)
+
+parser.add_argument(
+    "--profile",
+    type=str,
+    default=None,
+    help="把整次运行的 cProfile 数据写入该文件（可用 snakeviz / pstats 查看）",
 )
 
 args = parser.parse_args()
@@ -74,30 +275,179 @@ async def main():
     mode = args.mode
     force = args.force
     tqdm.write(f"Now running on {mode}!")
+    if args.book_id and not args.no_edition:
+        # 同一个标识用在多本书上会串用彼此的旧版本译文
+        multiple = mode == "serve" or (
+            (mode == "batch" or (mode == "bulk" and os.path.isdir(epub_path))) and len(collect_books(epub_path)) > 1
+        )
+        if multiple:
+            tqdm.write("--book-id 只能用于单本书，批量/服务模式下请去掉该参数")
+            exit(1)
     match mode:
-        case "trans":
+        case "trans" | "batch" | "serve":
             pass
+        case "bulk":
+            # 批处理接口按单个配置提交，不支持服务池/权重写法
+            if "," in ai or ":" in ai:
+                tqdm.write(f"bulk 模式只支持单个 OpenAI 兼容配置（如 openai、free），不支持服务池: {ai}")
+                exit(1)
+            if ai != "foo" and not args.bulk_local and not has_profile(ai):
+                tqdm.write(f"bulk 模式找不到配置 {ai}：需要 .env 中的 {profile_prefix(ai)}API_KEY")
+                exit(1)
 
         case "package":
             cp = Checkpoint(epub_path)
             EpubTool.package_epub(cp)
             exit(0)
         case "extract":
-            Checkpoint(epub_path, force)
+            Checkpoint(epub_path, force, lazy=args.no_extract)
+            exit(0)
+        case "estimate":
+            # 不调用 API：按当前的批量/预过滤/拆分/限流设置估算 token、请求数、费用与耗时
+            # 只读不写，--force 不生效（不能清掉已有进度）
+            books = [epub_path] if epub_path.lower().endswith(".epub") else collect_books(epub_path)
+            splitter = ParagraphSplitter(args.split_tokens) if args.split_tokens >= 0 else None
+            checkpoints = [
+                Checkpoint(book, False, batch_tokens=args.batch_tokens, lazy=args.no_extract, splitter=splitter)
+                for book in books
+            ]
+            prefilter = None if args.no_prefilter else Prefilter(args.skip_class or DEFAULT_CLASSES, args.skip_regex)
+            providers = [spec.partition(":")[0].strip() for spec in ai.split(",") if spec.strip()]
+            estimate_books(checkpoints, providers, tasks, prefilter)
             exit(0)
     tqdm.write(f"使用:[{ai}]\n处理：{epub_path}\n并行运行: {tasks}个任务！")
 
-    translator = [get_translator(ai)]
-    cp = Checkpoint(epub_path, args.force, translator)
+    work_dir = epub_path if os.path.isdir(epub_path) else os.path.dirname(epub_path)
+    memory = None
+    if not args.no_tm:
+        tm_path = args.tm or os.path.join(work_dir, "tmp", "translation_memory.sqlite3")
+        memory = TranslationMemory(tm_path)
+    edition = None
+    if not args.no_edition:
+        edition = EditionStore(args.edition_store or os.path.join(work_dir, "tmp", "editions.sqlite3"))
+
+    if mode == "bulk":
+        bulk_local = args.bulk_local or (os.path.join(work_dir, "tmp", "batch_local") if ai == "foo" else None)
+        endpoint = LocalBatchEndpoint(bulk_local) if bulk_local else None
+        translator = [BatchAPITranslator(prompt, "openai" if ai == "foo" else ai, endpoint, args.poll_interval)]
+    else:
+        translator = [get_translator(ai, memory, args.hedge, args.hedge_budget)]
+    hedger = find_layer(translator[0], HedgedTranslator)
+    journal = ProgressJournal(fsync=args.fsync)
+    executor = None
+    if args.workers > 0 and not args.low_memory:
+        executor = ProcessPoolExecutor(args.workers)
+        # 尽早拉起工作进程，此时主进程还没有其他线程
+        executor.submit(os.getpid).result()
+    prefilter = None
+    if not args.no_prefilter:
+        prefilter = Prefilter(args.skip_class or DEFAULT_CLASSES, args.skip_regex)
+
+    splitter = None
+    if args.split_tokens >= 0:
+        splitter = ParagraphSplitter(args.split_tokens)
+
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = await serve_metrics(args.metrics_port)
+        tqdm.write(f"指标: http://127.0.0.1:{metrics_server.sockets[0].getsockname()[1]}/metrics")
+    exporter = None
+    if args.metrics_file:
+        exporter = JsonlExporter(args.metrics_file)
+        exporter.start()
+
+    def make_checkpoint(path, force=args.force):
+        return Checkpoint(
+            path,
+            force,
+            translator,
+            journal,
+            batch_tokens=args.batch_tokens,
+            lazy=args.no_extract,
+            prefilter=prefilter,
+            executor=executor,
+            edition=edition,
+            book_id=args.book_id,
+            low_memory=args.low_memory,
+            publish=not args.no_publish,
+            splitter=splitter,
+        )
 
-    for file_path in cp.get_next_file():
-        if not os.path.exists(file_path):
-            tqdm.write(f"{file_path} 不存在！")
-            break
-        await cp.translate_epub(file_path, tasks)
+    try:
+        if mode == "serve":
+            # 常驻服务：翻译器、连接池与限流器在任务之间复用，通过 HTTP / Unix socket 提交与管理任务
+            service = TranslationService(make_checkpoint, translator[0], tasks, args.window, args.jobs, work_dir)
+            host, _, port = args.listen.rpartition(":")
+            server = await service.serve(host or "127.0.0.1", int(port), args.socket)
+            stop = asyncio.Event()
+            try:
+                # 收到 SIGTERM 时与 Ctrl+C 一样正常退出（保存进度、关闭连接）
+                asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+            except (NotImplementedError, AttributeError):
+                pass
+            try:
+                await stop.wait()
+            finally:
+                server.close()
+                await service.close()
+            return
 
-    EpubTool.package_epub(cp)
+        if mode == "batch" or (mode == "bulk" and os.path.isdir(epub_path)):
+            # 多本书共用一个工作池，--tasks 为全局并发数
+            books = collect_books(epub_path)
+            tqdm.write(f"批量处理 {len(books)} 本书")
+            checkpoints = [make_checkpoint(book) for book in books]
+        else:
+            checkpoints = [make_checkpoint(epub_path)]
+        if mode == "bulk":
+            await BulkRunner(checkpoints, translator[0]).run()
+            return
+        # 单本书也走流水线：预读解析、跨章节翻译、后台回填
+        guard = MemoryGuard(args.max_rss) if args.max_rss else None
+        runner = BatchRunner(checkpoints, translator[0], tasks, window=args.window, memory_guard=guard)
+        await runner.run()
+    finally:
+        await journal.close()
+        await close_http_client()
+        if executor is not None:
+            executor.shutdown()
+        if hedger is not None:
+            logger.info(f"对冲请求统计: {hedger.stats()}")
+            tqdm.write(f"对冲请求统计: {hedger.stats()}")
+        if prefilter is not None and prefilter.total:
+            summary = ", ".join(f"{k}={v}" for k, v in prefilter.skipped.items())
+            logger.info(f"预过滤跳过 {prefilter.total} 段 ({summary})")
+            tqdm.write(f"预过滤跳过 {prefilter.total} 段，节省 {prefilter.total} 次逐段请求 ({summary})")
+        if splitter is not None and splitter.split_count:
+            logger.info(f"超长段落拆分 {splitter.split_count} 段，拆分阈值 {splitter.threshold()} tokens")
+            tqdm.write(f"超长段落拆分 {splitter.split_count} 段，拆分阈值 {splitter.threshold()} tokens")
+        if exporter is not None:
+            await exporter.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        if edition is not None:
+            logger.info(f"跨版本译文库统计: {edition.stats()}")
+            tqdm.write(f"跨版本译文库统计: {edition.stats()}")
+            edition.close()
+        if memory is not None:
+            logger.info(f"翻译记忆统计: {memory.stats()}")
+            tqdm.write(f"翻译记忆统计: {memory.stats()}")
+            memory.close()
+        peak = peak_rss_mb()
+        if peak is not None:
+            logger.info(f"内存峰值: {peak:.1f}MB")
+            tqdm.write(f"内存峰值: {peak:.1f}MB")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            asyncio.run(main())
+        finally:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            tqdm.write(f"cProfile 数据已写入 {args.profile}")
+    else:
+        asyncio.run(main())
@@ -0,0 +1,115 @@
+import os
+import re
+import sys
+import zipfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.epub_gen import generate
+from tools.bulk import BulkRunner
+from tools.checkpoint import Checkpoint
+from tools.journal import ProgressJournal
+from translators.base_api import prompt
+from translators.batch_api import BatchAPITranslator, LocalBatchEndpoint
+
+_marker = re.compile(r"<!--\s*§\d+\s*-->")
+
+
+class BulkRunnerTest(unittest.IsolatedAsyncioTestCase):
+    """BulkRunner 对本地批处理替身 LocalBatchEndpoint 的端到端测试"""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.epub_path = os.path.join(self.tmp.name, "book.epub")
+        generate(self.epub_path, chapters=3, paragraphs=20, words=20, images=0)
+        self.local_dir = os.path.join(self.tmp.name, "local")
+        self.journal = ProgressJournal()
+
+    async def asyncTearDown(self):
+        await self.journal.close()
+        self.tmp.cleanup()
+
+    def checkpoint(self, force=False, batch_tokens=0):
+        return Checkpoint(self.epub_path, force, [], self.journal, batch_tokens=batch_tokens)
+
+    def translator(self, **endpoint):
+        return BatchAPITranslator(prompt, "openai", LocalBatchEndpoint(self.local_dir, **endpoint), poll_interval=0.01)
+
+    def output(self):
+        with zipfile.ZipFile(os.path.join(self.tmp.name, "bi_book.epub")) as zf:
+            return zf.namelist(), {n: zf.read(n) for n in zf.namelist() if n.endswith(".xhtml")}
+
+    async def test_submit_and_package(self):
+        cp = self.checkpoint(force=True)
+        await BulkRunner([cp], self.translator()).run()
+
+        jobs = cp.data["batch_jobs"]
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0]["state"], "applied")
+        self.assertEqual(jobs[0]["missing"], 0)
+        self.assertTrue(all(cp.data["files"].values()))
+
+        names, chapters = self.output()
+        # 批处理的输入/结果文件不能出现在输出的 EPUB 中
+        self.assertFalse([n for n in names if n.endswith((".jsonl", ".out"))])
+        self.assertTrue(all(b"__trans__" in data for data in chapters.values()))
+
+    async def test_resume_running_job(self):
+        cp = self.checkpoint(force=True)
+        # 提交后进程“中断”：任务仍在处理中
+        await BulkRunner([cp], self.translator(delay=3600)).submit(cp)
+        self.assertEqual([job["state"] for job in cp.data["batch_jobs"]], ["submitted"])
+
+        cp = self.checkpoint()
+        await BulkRunner([cp], self.translator()).run()
+
+        # 继续轮询原任务，不重复提交
+        jobs = cp.data["batch_jobs"]
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0]["state"], "applied")
+        self.assertTrue(all(cp.data["files"].values()))
+
+    async def test_partial_failure_resubmits_missing(self):
+        cp = self.checkpoint(force=True)
+        await BulkRunner([cp], self.translator(fail_every=5)).run()
+
+        first = cp.data["batch_jobs"][0]
+        self.assertGreater(first["missing"], 0)
+        self.assertFalse(all(cp.data["files"].values()))
+
+        cp = self.checkpoint()
+        await BulkRunner([cp], self.translator()).run()
+
+        second = cp.data["batch_jobs"][1]
+        # 只重新提交失败的请求
+        self.assertEqual(len(second["custom_ids"]), first["missing"])
+        self.assertEqual(second["missing"], 0)
+        self.assertTrue(all(cp.data["files"].values()))
+
+    async def test_marker_mismatch_resubmits_unit(self):
+        def drop_markers(body):
+            return _marker.sub("", LocalBatchEndpoint.echo(body))
+
+        cp = self.checkpoint(force=True, batch_tokens=400)
+        await BulkRunner([cp], self.translator(respond=drop_markers)).run()
+
+        first = cp.data["batch_jobs"][0]
+        multi = [cid for cid in first["custom_ids"] if "," in cid.rpartition("|")[2]]
+        self.assertTrue(multi)
+        self.assertGreater(first["missing"], 0)
+
+        cp = self.checkpoint(batch_tokens=400)
+        await BulkRunner([cp], self.translator()).run()
+
+        def paragraphs(custom_ids):
+            return {(file, idx) for cid in custom_ids for file, unit in [BulkRunner.parse_id(cp, cid)] for idx in unit}
+
+        # 重新提交的正是拆分失败的那些段落
+        self.assertEqual(paragraphs(cp.data["batch_jobs"][1]["custom_ids"]), paragraphs(multi))
+        self.assertTrue(all(cp.data["files"].values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.prefilter import Prefilter
+
+
+def paragraph(markup):
+    root = etree.fromstring(f"<div>{markup}</div>")
+    return root.find(".//p")
+
+
+class PrefilterTest(unittest.TestCase):
+    """本地预过滤的判定规则"""
+
+    def setUp(self):
+        self.prefilter = Prefilter()
+
+    def classify(self, markup):
+        return self.prefilter.classify(paragraph(markup))
+
+    def test_prose_with_prompt_like_prefix_is_translated(self):
+        for text in (
+            "... and then it was over, she said quietly.",
+            "…and then it was over, she said quietly…",
+            "> Quoted from the original letter, which arrived late.",
+            "# of users who log in every day keeps growing.",
+            "% of the budget went to marketing this year.",
+        ):
+            with self.subTest(text=text):
+                self.assertIsNone(self.classify(f"<p>{text}</p>"))
+
+    def test_prompt_with_code_context_is_skipped(self):
+        self.assertEqual(self.classify("<p>&gt;&gt;&gt; import os; os.getcwd()</p>"), "code")
+        self.assertEqual(self.classify("<p>$ make &amp;&amp; make install</p>"), "code")
+        self.assertEqual(self.classify("<pre><p>$ ls -la /var/log</p></pre>"), "code")
+
+    def test_skip_class(self):
+        self.assertEqual(self.classify('<div class="programlisting"><p>$ ls -la</p></div>'), "class")
+
+    def test_numeric(self):
+        self.assertEqual(self.classify("<p>— 42 —</p>"), "numeric")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+from tqdm.asyncio import tqdm
+from collections import deque
+from .epub_utils import EpubTool
+from .workers import WorkerBoard
+
+import os
+import logging
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+
+def collect_books(path):
+    """批量模式的输入：EPUB 所在目录，或每行一个 EPUB 路径的列表文件"""
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.endswith(".epub") and not name.startswith("bi_")
+        )
+
+    base = os.path.dirname(path)
+    books = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            book = line if os.path.isabs(line) else os.path.join(base, line)
+            if os.path.exists(book):
+                books.append(book)
+            else:
+                tqdm.write(f"epub book:[{book}] not exist!")
+    return books
+
+
+class FairQueue:
+    """按来源轮转出队：每次从下一个有任务的来源取一项，避免某本书独占工作池"""
+
+    def __init__(self):
+        self.queues = {}
+        self.order = deque()
+        self.open = set()
+        self.cond = asyncio.Condition()
+
+    def register(self, source):
+        self.queues[source] = deque()
+        self.order.append(source)
+        self.open.add(source)
+
+    async def put(self, source, items):
+        async with self.cond:
+            self.queues[source].extend(items)
+            self.cond.notify_all()
+
+    async def close(self, source):
+        async with self.cond:
+            self.open.discard(source)
+            self.cond.notify_all()
+
+    async def get(self):
+        """取下一项 (来源, 任务)；所有来源都已关闭且没有剩余任务时返回 None"""
+        async with self.cond:
+            while True:
+                for _ in range(len(self.order)):
+                    source = self.order[0]
+                    self.order.rotate(-1)
+                    if self.queues[source]:
+                        return source, self.queues[source].popleft()
+
+                if not self.open:
+                    return None
+                await self.cond.wait()
+
+
+class ChapterJob:
+    def __init__(self, file_path, doc, units):
+        self.file_path = file_path
+        self.doc = doc
+        self.remaining = units
+        self.failed = False
+        self.done = asyncio.Event()
+        if units == 0:
+            self.done.set()
+
+    def unit_done(self):
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self.done.set()
+
+
+class BatchRunner:
+    """多本书共享一个工作池：每本书有独立的 Checkpoint，段落按书轮转调度，整本翻完即打包
+
+    每本书内部是流水线：预读解析 -> 翻译 -> 回填提交。最多 window 个章节同时在途，
+    第 N 章的收尾与回填期间，第 N+1 章的段落已经在占用工作池
+    """
+
+    def __init__(self, checkpoints, translate_ai, workers, window=2, memory_guard=None):
+        self.checkpoints = checkpoints
+        self.translate_ai = translate_ai
+        self.workers = max(1, workers)
+        self.window = max(1, window)
+        # 内存上限：超过时暂停预读新章节，直到在途章节提交
+        self.memory_guard = memory_guard
+        self.in_flight = 0
+        self.queue = FairQueue()
+        self.bar = None
+        self.board = None
+
+    async def run(self):
+        for cp in self.checkpoints:
+            self.queue.register(cp)
+
+        desc = self.checkpoints[0].file_name[:20] if len(self.checkpoints) == 1 else "batch"
+        with tqdm(total=0, desc=desc, ncols=80, unit="p") as self.bar, WorkerBoard(self.workers) as self.board:
+            feeders = [asyncio.create_task(self.feed(cp)) for cp in self.checkpoints]
+            workers = [asyncio.create_task(self.work(n)) for n in range(self.workers)]
+            await asyncio.gather(*feeders, *workers)
+
+    async def feed(self, cp):
+        """按章节顺序把一本书的请求单元放入共享队列；章节翻完后由 commit 在后台回填，全书完成后打包"""
+        slots = asyncio.Semaphore(self.window)
+        jobs = asyncio.Queue()
+        committer = asyncio.create_task(self.commit(cp, jobs, slots))
+        try:
+            for file_path in cp.get_next_file():
+                if not cp.exists(file_path):
+                    tqdm.write(f"{file_path} 不存在！")
+                    continue
+
+                if self.memory_guard is not None:
+                    await self.memory_guard.wait(lambda: self.in_flight > 0)
+                # 在途章节达到 window 时等待最早的章节提交
+                await slots.acquire()
+                progress, doc = await cp.prepare_chapter(file_path)
+                if progress is None:
+                    slots.release()
+                    continue
+
+                # 只排入未翻译的段落，章节内长段落优先，章节收尾时剩下的都是短请求
+                units = cp.schedule_units(doc, progress)
+                job = ChapterJob(file_path, doc, len(units))
+                self.in_flight += 1
+                self.bar.total += sum(len(unit) for _, unit in units)
+                self.bar.refresh()
+                await self.queue.put(cp, [(job, tokens, unit) for tokens, unit in units])
+                await jobs.put(job)
+
+            await jobs.put(None)
+            await committer
+            await asyncio.to_thread(EpubTool.package_epub, cp)
+        except Exception as e:
+            logger.error(f"{cp.file_name} 处理失败: {e}")
+            tqdm.write(f"{cp.file_name} 处理失败: {e}")
+        finally:
+            # 出错或被取消（服务模式下取消任务）时不留下孤立的回填任务
+            committer.cancel()
+            await self.queue.close(cp)
+
+    async def commit(self, cp, jobs, slots):
+        """按章节顺序等待翻译完成并回填，每提交一章释放一个在途名额"""
+        while (job := await jobs.get()) is not None:
+            await job.done.wait()
+            try:
+                if job.failed:
+                    tqdm.write(f"处理:{job.file_path}出现错误，已跳过")
+                    cp.documents.pop(job.file_path, None)
+                else:
+                    await cp.finish_chapter(job.file_path)
+            except Exception as e:
+                logger.error(f"{job.file_path} 回填失败: {e}")
+                tqdm.write(f"{job.file_path} 回填失败: {e}")
+            finally:
+                self.in_flight -= 1
+                slots.release()
+
+    async def work(self, n):
+        while (entry := await self.queue.get()) is not None:
+            cp, (job, tokens, unit) = entry
+            self.board.start(n, job.file_path, unit, tokens)
+            try:
+                await cp.translate_segments(job.file_path, unit, job.doc, self.translate_ai)
+            except Exception as e:
+                logger.error(f"{job.file_path} 翻译失败: {e}")
+                job.failed = True
+            self.board.finish(n)
+            self.bar.update(len(unit))
+            job.unit_done()
@@ -0,0 +1,171 @@
+from tqdm.asyncio import tqdm
+from .epub_utils import EpubTool
+from .journal import ProgressJournal
+from translators.base_api import join_segments
+
+import os
+import json
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# OpenAI 批处理单个输入文件的上限：50000 个请求、200MB
+MAX_REQUESTS = 50_000
+MAX_BYTES = 190 * (1 << 20)
+
+
+class BulkRunner:
+    """离线批量翻译：把所有待译段落写成批处理任务提交，轮询完成后写回进度文件，
+    再走原有的 finish_chapter / package_epub 流程
+
+    任务记录在检查点的 batch_jobs 中：中断后重新运行会继续轮询已提交的任务，
+    只为既没有译文、也不在未完成任务中的段落提交新任务；失败或拆分不上的段落在下一次运行时重新提交
+    """
+
+    def __init__(self, checkpoints, translator, max_requests=MAX_REQUESTS, max_bytes=MAX_BYTES):
+        self.checkpoints = checkpoints
+        self.translator = translator
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def jobs(cp):
+        return cp.data.setdefault("batch_jobs", [])
+
+    @staticmethod
+    def job_dir(cp):
+        """批处理的输入/结果文件放在工作目录之外（含原文与提示词，不能被打包进输出的 EPUB）"""
+        path = f"{cp.extract_dir}.batch"
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def custom_id(cp, file_path, unit):
+        rel = os.path.relpath(file_path, cp.extract_dir).replace(os.sep, "/")
+        return f"{rel}|{','.join(map(str, unit))}"
+
+    @staticmethod
+    def parse_id(cp, custom_id):
+        rel, _, indices = custom_id.rpartition("|")
+        return os.path.join(cp.extract_dir, rel), [int(i) for i in indices.split(",")]
+
+    async def collect(self, cp):
+        """返回待提交的 (custom_id, 文本)；跳过仍在未完成任务中的段落"""
+        open_ids = {cid for job in self.jobs(cp) if job["state"] == "submitted" for cid in job["custom_ids"]}
+        pending = set()
+        for cid in open_ids:
+            file_path, unit = self.parse_id(cp, cid)
+            pending.update((file_path, i) for i in unit)
+
+        requests = []
+        for file_path in cp.get_next_file():
+            if not cp.exists(file_path):
+                continue
+            progress, doc = await cp.prepare_chapter(file_path)
+            if progress is None:
+                continue
+            for unit in cp.plan_units(0, len(doc), doc, progress):
+                unit = [i for i in unit if (file_path, i) not in pending]
+                if not unit:
+                    continue
+                texts = [doc.source(i) for i in unit]
+                body = texts[0] if len(texts) == 1 else join_segments(texts)
+                requests.append((self.custom_id(cp, file_path, unit), body))
+            # 只需要段落原文，提交后不再持有解析结果
+            cp.documents.pop(file_path, None)
+        return requests
+
+    def _write_inputs(self, cp, requests):
+        """按请求数与文件大小上限切分成多个 JSONL 输入文件"""
+        files, lines, size = [], [], 0
+        stamp = time.strftime("%Y%m%d%H%M%S")
+        job_dir = self.job_dir(cp)
+
+        def flush():
+            path = os.path.join(job_dir, f"batch_{stamp}_{len(files)}.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(line for _, line in lines)
+            files.append((path, [cid for cid, _ in lines]))
+
+        for cid, text in requests:
+            line = json.dumps(self.translator.request_line(cid, text), ensure_ascii=False) + "\n"
+            if lines and (len(lines) >= self.max_requests or size + len(line.encode("utf-8")) > self.max_bytes):
+                flush()
+                lines, size = [], 0
+            lines.append((cid, line))
+            size += len(line.encode("utf-8"))
+        if lines:
+            flush()
+        return files
+
+    async def submit(self, cp):
+        requests = await self.collect(cp)
+        if not requests:
+            return
+        for path, custom_ids in self._write_inputs(cp, requests):
+            batch_id = await self.translator.submit(path, {"book": cp.file_name[:64]})
+            self.jobs(cp).append(
+                {"id": batch_id, "input": path, "state": "submitted", "submitted": time.time(), "custom_ids": custom_ids}
+            )
+            # 提交后立即保存，进程中断时不会重复提交
+            cp.save()
+            tqdm.write(f"[{cp.file_name}] 已提交批处理任务 {batch_id}：{len(custom_ids)} 个请求")
+
+    async def collect_results(self, cp, job):
+        """等待任务结束，把结果写回进度文件"""
+        batch = await self.translator.wait(job["id"])
+        found = await self.translator.results(batch, f"{job['input']}.out")
+
+        written = missing = 0
+        for cid in job["custom_ids"]:
+            file_path, unit = self.parse_id(cp, cid)
+            content = found.get(cid)
+            results = self.translator.split(content, len(unit)) if content is not None else None
+            if results is None:
+                missing += len(unit)
+                continue
+            for idx, translated in zip(unit, results):
+                await cp.update_chapter_process(file_path, idx, translated)
+            written += len(unit)
+        await cp.journal.flush()
+
+        for entry in self.jobs(cp):
+            if entry["id"] == job["id"]:
+                entry.update(state="applied" if batch["status"] == "completed" else batch["status"], written=written, missing=missing)
+        cp.save()
+        tqdm.write(f"[{cp.file_name}] 批处理任务 {job['id']} {batch['status']}：写回 {written} 段，缺失 {missing} 段")
+
+    async def finish(self, cp):
+        """所有段落都有译文的章节回填；全部完成后打包"""
+        done = True
+        for file_path in cp.get_next_file():
+            if cp.data["files"].get(file_path) or not cp.exists(file_path):
+                continue
+            cp_data_path = cp.cp_data_path(file_path)
+            progress = ProgressJournal.load(cp_data_path) if os.path.exists(cp_data_path) else {}
+            if not progress:
+                continue
+            if any(len(v) == 0 for v in progress.values()):
+                done = False
+                continue
+            await cp.finish_chapter(file_path)
+
+        if done:
+            await asyncio.to_thread(EpubTool.package_epub, cp)
+        else:
+            tqdm.write(f"[{cp.file_name}] 仍有段落没有译文，重新运行 bulk 模式提交剩余部分（或改用 trans 模式补齐）")
+
+    async def run_book(self, cp):
+        try:
+            await self.submit(cp)
+            open_jobs = [job for job in self.jobs(cp) if job["state"] == "submitted"]
+            await asyncio.gather(*(self.collect_results(cp, job) for job in open_jobs))
+            await self.finish(cp)
+        except Exception as e:
+            logger.error(f"{cp.file_name} 批处理失败: {e}")
+            tqdm.write(f"{cp.file_name} 批处理失败: {e}")
+
+    async def run(self):
+        await asyncio.gather(*(self.run_book(cp) for cp in self.checkpoints))
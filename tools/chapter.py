@@ -0,0 +1,190 @@
+from lxml import etree, html as lxml_html
+
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+XHTML_NS = "http://www.w3.org/1999/xhtml"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+TRANS_CLASS = "__trans__"
+
+_xml_parser = etree.XMLParser(resolve_entities=False, huge_tree=True, no_network=True)
+_xmlns_attr = re.compile(r'\s+xmlns(?::[\w.-]+)?="[^"]*"')
+_xml_decl = re.compile(rb"^(?:\xef\xbb\xbf)?\s*<\?xml\b[^>]*\?>")
+_decl_encoding = re.compile(rb"""encoding\s*=\s*["']([\w.:-]+)["']""")
+_doctype = re.compile(rb"^(?:\xef\xbb\xbf)?(?:\s|<!--.*?-->)*<!DOCTYPE\b", re.I | re.S)
+
+
+def _localname(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else None
+
+
+def _text_len(el):
+    # 与 bs4 的 get_text(strip=True) 一致：每个文本节点去掉首尾空白后再计数
+    return sum(len(t.strip()) for t in el.itertext())
+
+
+class ChapterDocument:
+    """章节文档：lxml 只解析一次，段落下标在提取、判重、回填的全过程中保持不变"""
+
+    def __init__(self, tree, is_xml):
+        self.tree = tree
+        self.root = tree.getroot()
+        self.is_xml = is_xml
+        self.xml_declaration = is_xml
+        self.doctype = tree.docinfo.doctype
+        self.ns = etree.QName(self.root).namespace if is_xml else None
+        self.translated = False
+        self.paragraphs = []
+
+        for p in self.root.iter(f"{{{XHTML_NS}}}p", "p"):
+            if TRANS_CLASS in p.get("class", "").split():
+                self.translated = True
+                break
+            if _text_len(p) > 1:
+                self.paragraphs.append(p)
+
+    @classmethod
+    def parse(cls, data: bytes):
+        try:
+            return cls(etree.fromstring(data, _xml_parser).getroottree(), True)
+        except etree.XMLSyntaxError as e:
+            # 不规范的 XHTML（如未声明的 &nbsp;）退回宽松的 HTML 解析
+            logger.warning(f"XHTML 解析失败，改用 HTML 解析: {e}")
+
+        # HTML 解析器会把 XML 声明变成注释（<!--?xml ...?-->）：先去掉，按声明的编码解析，输出时重新生成
+        decl = _xml_decl.match(data)
+        parser = None
+        if decl:
+            encoding = _decl_encoding.search(decl.group())
+            parser = lxml_html.HTMLParser(encoding=encoding.group(1).decode() if encoding else "utf-8")
+            data = data[decl.end():]
+        doc = cls(lxml_html.document_fromstring(data, parser=parser).getroottree(), False)
+        doc.xml_declaration = decl is not None
+        if not _doctype.match(data):
+            # 源文件没有 DOCTYPE 时去掉 lxml 补上的 HTML 4.0 Transitional
+            doc.tree.docinfo.clear()
+            doc.doctype = None
+        return doc
+
+    def __len__(self):
+        return len(self.paragraphs)
+
+    def source(self, idx):
+        """段落的 HTML 源码（去掉 lxml 补上的命名空间声明），即发给模型的原文"""
+        text = etree.tostring(self.paragraphs[idx], encoding="unicode", with_tail=False)
+        end = text.find(">")
+        return _xmlns_attr.sub("", text[:end]) + text[end:]
+
+    def _parse_fragment(self, translated):
+        if self.is_xml:
+            decls = "".join(
+                f' xmlns="{uri}"' if prefix is None else f' xmlns:{prefix}="{uri}"'
+                for prefix, uri in self.root.nsmap.items()
+            )
+            try:
+                wrapper = etree.fromstring(f"<wrap{decls}>{translated}</wrap>", _xml_parser)
+                return wrapper.text, list(wrapper)
+            except etree.XMLSyntaxError:
+                pass
+
+        nodes = lxml_html.fragments_fromstring(translated)
+        lead = nodes.pop(0) if nodes and isinstance(nodes[0], str) else None
+        if self.is_xml:
+            for node in nodes:
+                self._to_xhtml(node)
+        return lead, nodes
+
+    def _to_xhtml(self, node):
+        """把 HTML 解析出的节点改写到文档的命名空间下"""
+        nsmap = self.root.nsmap
+        for el in node.iter():
+            if not isinstance(el.tag, str):
+                continue
+            if self.ns and not el.tag.startswith("{"):
+                el.tag = f"{{{self.ns}}}{el.tag}"
+            for name in [n for n in el.attrib if ":" in n and not n.startswith("{")]:
+                value = el.attrib.pop(name)
+                prefix, local = name.split(":", 1)
+                uri = XML_NS if prefix == "xml" else nsmap.get(prefix)
+                if uri:
+                    el.set(f"{{{uri}}}{local}", value)
+
+    def insert_translation(self, idx, translated):
+        p = self.paragraphs[idx]
+        trans = etree.Element(f"{{{self.ns}}}p" if self.ns else "p")
+        trans.set("class", TRANS_CLASS)
+
+        try:
+            lead, nodes = self._parse_fragment(translated)
+        except (etree.ParserError, ValueError) as e:
+            logger.warning(f"译文无法解析，按纯文本插入: {e}")
+            lead, nodes = translated, []
+
+        trans.text = lead
+        for node in nodes:
+            trans.append(node)
+
+        # 紧贴原段落插入，原段落后的空白留给译文段落
+        trans.tail = p.tail
+        p.tail = None
+        p.addnext(trans)
+
+    def serialize(self) -> bytes:
+        if self.is_xml:
+            return etree.tostring(self.tree, encoding="utf-8", xml_declaration=True)
+        return etree.tostring(
+            self.tree,
+            encoding="utf-8",
+            method="xml",
+            xml_declaration=self.xml_declaration,
+            doctype=self.doctype,
+        )
+
+
+class ChapterSummary:
+    """进程池模式下主进程持有的章节信息：只有段落源码与预过滤结果，不含 lxml 树"""
+
+    def __init__(self, sources, translated, skip_reasons=None):
+        self.sources = sources
+        self.translated = translated
+        self.skip_reasons = skip_reasons or {}
+
+    def __len__(self):
+        return len(self.sources)
+
+    def source(self, idx):
+        return self.sources[idx]
+
+
+def summarize_chapter(data: bytes, prefilter=None):
+    """（工作进程）解析章节，提取段落源码，并按预过滤规则预先判定"""
+    doc = ChapterDocument.parse(data)
+    if doc.translated:
+        return ChapterSummary([], True)
+
+    skip_reasons = {}
+    if prefilter is not None:
+        for idx, p in enumerate(doc.paragraphs):
+            reason = prefilter.classify(p)
+            if reason is not None:
+                skip_reasons[idx] = reason
+    return ChapterSummary([doc.source(i) for i in range(len(doc))], False, skip_reasons)
+
+
+def apply_chapter(data: bytes, translations: dict, out_path):
+    """（工作进程）重新解析章节，插入译文并写出到 out_path，返回插入的段落数"""
+    doc = ChapterDocument.parse(data)
+    count = 0
+    for idx, translated in translations.items():
+        if idx < 0 or idx >= len(doc):
+            logger.warning(f"索引 {idx} 超出范围，跳过")
+            continue
+        doc.insert_translation(idx, translated)
+        count += 1
+
+    with open(out_path, "wb") as f:
+        f.write(doc.serialize())
+    return count
+
@@ -1,14 +1,23 @@
 from tqdm.asyncio import tqdm
-from bs4 import BeautifulSoup
 from pathlib import Path
-from .epub_utils import EpubTool
+from .chapter import ChapterDocument, apply_chapter, summarize_chapter
+from .epub_utils import EpubArchive, EpubPublisher, EpubTool
+from .journal import ProgressJournal
+from .lowmem import ChapterIndex
+from .metrics import registry, timed
+from .prefilter import SKIPPED
+from .workers import WorkerBoard, longest_first
+from translators.base_api import BatchMismatchError, estimate_tokens
+from translators.memory import is_placeholder, model_key
+from translators.rate_governor import RequestTimer
 
 import os
 import json
 import logging
 import xml.etree.ElementTree as ET
-import json, os, math
+import json, os
 import shutil
+import hashlib
 import asyncio
 
 logger = logging.getLogger(__name__)
@@ -16,21 +25,52 @@ logger = logging.getLogger(__name__)
 
 class EpubParser:
     @staticmethod
-    def get_spine_files(extract_dir, is_chapter):
-        """解析 EPUB，获取阅读顺序中的正文文件（优先 toc.ncx，其次 spine）"""
-        # 1. container.xml 找到 OPF 文件路径
+    def _parse_xml(path, archive):
+        if archive is None:
+            return ET.parse(path)
+        with archive.open(path) as f:
+            return ET.parse(f)
+
+    @staticmethod
+    def _opf_path(extract_dir, archive):
+        """container.xml 中登记的 OPF 文件路径"""
         container_path = os.path.join(extract_dir, "META-INF", "container.xml")
-        tree = ET.parse(container_path)
+        tree = EpubParser._parse_xml(container_path, archive)
         root = tree.getroot()
         opf_path = root.find(
             ".//{urn:oasis:names:tc:opendocument:xmlns:container}rootfile"
         ).get("full-path")
+        return os.path.join(extract_dir, opf_path)
+
+    @staticmethod
+    def get_book_id(extract_dir, archive=None):
+        """书的标识：OPF 中 unique-identifier 指向的 dc:identifier，其次任一 dc:identifier，最后是书名"""
+        root = EpubParser._parse_xml(EpubParser._opf_path(extract_dir, archive), archive).getroot()
+        dc = "{http://purl.org/dc/elements/1.1/}"
+        identifiers = root.findall(f".//{dc}identifier")
+        unique_id = root.get("unique-identifier")
+        for ident in identifiers:
+            if unique_id and ident.get("id") == unique_id and (ident.text or "").strip():
+                return ident.text.strip()
+        for ident in identifiers:
+            if (ident.text or "").strip():
+                return ident.text.strip()
+        title = root.find(f".//{dc}title")
+        return (title.text or "").strip() if title is not None else None
 
-        opf_full_path = os.path.join(extract_dir, opf_path)
+    @staticmethod
+    def get_spine_files(extract_dir, is_chapter, archive=None):
+        """解析 EPUB，获取阅读顺序中的正文文件（优先 toc.ncx，其次 spine）
+        传入 archive 时，文件从 EpubArchive 读取（不要求已解压）
+        """
+        exists = archive.exists if archive is not None else os.path.exists
+
+        # 1. container.xml 找到 OPF 文件路径
+        opf_full_path = EpubParser._opf_path(extract_dir, archive)
         opf_dir = os.path.dirname(opf_full_path)
 
         # 2. 解析 OPF
-        tree = ET.parse(opf_full_path)
+        tree = EpubParser._parse_xml(opf_full_path, archive)
         root = tree.getroot()
 
         manifest = {}
@@ -46,8 +86,8 @@ class EpubParser:
                 ncx_path = os.path.join(opf_dir, href)
 
         # 3. 如果有 ncx，优先解析 navMap
-        if ncx_path and os.path.exists(ncx_path):
-            return EpubParser._parse_ncx(ncx_path, opf_dir, is_chapter)
+        if ncx_path and exists(ncx_path):
+            return EpubParser._parse_ncx(ncx_path, opf_dir, is_chapter, archive)
 
         # 4. 否则，回退到 spine
         logger.info("未找到 toc.ncx，回退到 spine")
@@ -61,9 +101,9 @@ class EpubParser:
         return spine_files
 
     @staticmethod
-    def _parse_ncx(ncx_path, opf_dir, is_chapter):
+    def _parse_ncx(ncx_path, opf_dir, is_chapter, archive=None):
         """解析 toc.ncx 获取正文文件列表"""
-        tree = ET.parse(ncx_path)
+        tree = EpubParser._parse_xml(ncx_path, archive)
         root = tree.getroot()
         ns = {"ncx": "http://www.daisy.org/z3986/2005/ncx/"}
 
@@ -82,18 +122,60 @@ class EpubParser:
 
 
 class Checkpoint:
-    def __init__(self, epub_path, force=False, translate_apis=[]):
+    def __init__(
+        self,
+        epub_path,
+        force=False,
+        translate_apis=[],
+        journal=None,
+        batch_tokens=0,
+        lazy=False,
+        prefilter=None,
+        executor=None,
+        edition=None,
+        book_id=None,
+        low_memory=False,
+        publish=False,
+        splitter=None,
+    ):
         self.epub_path = epub_path
         self.output_dir = os.path.dirname(self.epub_path)
         self.file_name: str = os.path.basename(self.epub_path)
-        self.extract_dir: str = os.path.join(self.output_dir, "tmp", self.file_name.split(".")[0].replace(" ",''))
+        self.extract_dir: str = os.path.join(self.output_dir, "tmp", os.path.splitext(self.file_name)[0].replace(" ", ""))
         self.force = force
         self.data = {"files": {}}
         self.checkpoint_file = f"{self.epub_path}.json"
         self.lock = asyncio.Lock()
         self.translate_apis = translate_apis
+        self.journal = journal or ProgressJournal()
+        self.batch_tokens = batch_tokens
+        # 本地预过滤：命中规则的段落不发送请求
+        self.prefilter = prefilter
+        # 进程池：解析与回填在工作进程中完成，事件循环只处理网络 I/O
+        self.executor = executor
+        # 跨版本复用：按 (书标识, 段落内容哈希) 复用旧版本的译文
+        self.edition = edition
+        self._book_id = book_id
+        # 低内存模式：段落只记录字节偏移，原文按需读取，回填时流式拼接
+        self.low_memory = low_memory
+        # 边翻译边发布：每完成一章即更新 bi_<书名>.epub
+        self.publisher = EpubPublisher(self) if publish else None
+        # 超长段落拆成多个请求并发翻译，再拼回一个段落
+        self.splitter = splitter
+        # 章节解析结果在翻译与回填之间复用，避免重复解析
+        self.documents = {}
+        # lazy: 不解压，章节按需从原书读取，工作目录只保存改动过的章节
+        self.lazy = lazy
+        self._archive = None
         if os.path.exists(self.checkpoint_file) and not self.force:
             self.load()
+            if self.source_changed():
+                # 同名的新版本：按新书重新开始，未改动的段落由跨版本译文库补齐
+                logger.warning(f"{self.file_name} 与上次运行时不同，重新开始")
+                tqdm.write(f"{self.file_name} 与上次运行时不同，重新开始")
+                self.clear()
+                self.lazy = lazy
+                self.init_checkpoint()
         else:
             self.init_checkpoint()
     
@@ -103,6 +185,7 @@ class Checkpoint:
     def load(self):
         with open(self.checkpoint_file, "r", encoding="utf-8") as f:
             self.data = json.load(f)
+        self.lazy = self.data.get("lazy", False)
         logger.info(f"已加载检查点: [{self.checkpoint_file}]，任务继续！")
 
     def save(self):
@@ -111,6 +194,50 @@ class Checkpoint:
         logger.info(f"检查点已保存: {self.checkpoint_file}")
         tqdm.write(f"检查点已保存: {self.checkpoint_file}")
 
+    def source_signature(self, with_hash=True):
+        stat = os.stat(self.epub_path)
+        signature = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        if with_hash:
+            digest = hashlib.sha256()
+            with open(self.epub_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            signature["sha256"] = digest.hexdigest()
+        return signature
+
+    def source_changed(self):
+        """原书与检查点记录的是否不同：大小与修改时间一致时直接认为未变，否则比较内容哈希"""
+        recorded = self.data.get("source")
+        if recorded is None:
+            # 旧版本的检查点没有记录原书信息
+            self.data["source"] = self.source_signature()
+            self.save()
+            return False
+        current = self.source_signature(with_hash=False)
+        if current["size"] == recorded["size"] and current["mtime"] == recorded["mtime"]:
+            return False
+        current = self.source_signature()
+        if current["sha256"] != recorded.get("sha256"):
+            return True
+        # 内容相同（如复制后修改时间变了），更新记录
+        self.data["source"] = current
+        self.save()
+        return False
+
+    def clear(self):
+        """删除工作目录、批处理任务文件与检查点"""
+        shutil.rmtree(self.extract_dir, ignore_errors=True)
+        shutil.rmtree(f"{self.extract_dir}.batch", ignore_errors=True)
+        try:
+            os.remove(self.checkpoint_file)
+        except FileNotFoundError:
+            pass
+        self.data = {"files": {}}
+        self.documents.clear()
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
     def init_checkpoint(self):
 
         if self.force:
@@ -120,137 +247,254 @@ class Checkpoint:
             logger.warning(f"强制清空进度:{self.checkpoint_file}!")
             tqdm.write(f"强制清空进度:{self.checkpoint_file}!")
             
-            shutil.rmtree(self.extract_dir, ignore_errors=True)
-
-            try:
-                os.remove(self.checkpoint_file)
-            except FileNotFoundError:
-                pass
+            self.clear()
 
         if os.path.exists(self.checkpoint_file):
             self.load()
             return
 
-        EpubTool.extract(self.epub_path, self.extract_dir)
+        if self.lazy:
+            os.makedirs(self.extract_dir, exist_ok=True)
+            tqdm.write(f"免解压模式，工作目录: {self.extract_dir}")
+        else:
+            EpubTool.extract(self.epub_path, self.extract_dir)
 
-        html_files = EpubParser.get_spine_files(self.extract_dir, self.is_chapter)
+        html_files = EpubParser.get_spine_files(
+            self.extract_dir, self.is_chapter, self.archive
+        )
         for f in html_files:
             self.data["files"][f] = False
+        self.data["lazy"] = self.lazy
+        self.data["book_id"] = EpubParser.get_book_id(self.extract_dir, self.archive)
+        self.data["source"] = self.source_signature()
         self.save()
 
+    @property
+    def book_id(self):
+        if self._book_id:
+            return self._book_id
+        if not self.data.get("book_id"):
+            # 旧版本的检查点没有记录书标识
+            self.data["book_id"] = EpubParser.get_book_id(self.extract_dir, self.archive) or self.file_name
+            self.save()
+        return self.data["book_id"]
+
+    @property
+    def archive(self):
+        """工作目录 + 原书的统一读取入口；已解压的文件优先读磁盘"""
+        if self._archive is None:
+            self._archive = EpubArchive(self.epub_path, self.extract_dir)
+        return self._archive
+
+    def exists(self, file_path):
+        return self.archive.exists(file_path)
+
     def get_next_file(self):
         for _, entry in enumerate(self.data["files"]):
             yield entry
 
     def complete_chapter(self, file_path):
+        ProgressJournal.compact(self.cp_data_path(file_path))
         self.data["files"][file_path] = True
         self.save()
 
+    def cp_data_path(self, file_path):
+        file_name = os.path.basename(file_path)
+        return os.path.join(self.extract_dir, f"{file_name}.cp_data")
+
+    @timed("load_chapter_process")
     async def load_chapter_process(self, file_path):
         # 不存在则创建，存在则加载，前提是对应的epub文件存在
 
-        p_tags = []
-        if not os.path.exists(file_path):
+        if not self.exists(file_path):
             tqdm.write(f"{file_path} not exist!")
             return None, None
 
-        with open(file_path, "r", encoding="utf-8") as fp:
-            soup = BeautifulSoup(fp, "html.parser")
-            for p in soup.find_all("p"):
-                if "__trans__" in p.get("class", []):
-                    tqdm.write(f"{file_path} 已翻译完成，跳过！")
-                    return None, None
+        doc = self.documents.get(file_path)
+        if doc is None:
+            doc = await self.parse_chapter(file_path)
+            self.documents[file_path] = doc
 
-                if len(p.get_text(strip=True)) > 1:
-                    p_tags.append(p)
+        if doc.translated:
+            tqdm.write(f"{file_path} 已翻译完成，跳过！")
+            self.documents.pop(file_path, None)
+            return None, None
 
-        file_name = os.path.basename(file_path)
-        cp_data_path = os.path.join(self.extract_dir, f"{file_name}.cp_data")
+        cp_data_path = self.cp_data_path(file_path)
 
         if os.path.exists(cp_data_path):
-            with open(cp_data_path, "r", encoding="utf-8") as f:
-                return json.load(f), p_tags
+            await self.journal.flush()
+            return ProgressJournal.load(cp_data_path), doc
 
         progress = {}
-        for idx in range(len(p_tags)):
+        for idx in range(len(doc)):
             progress[str(idx)] = ""
 
-        with open(cp_data_path, "w", encoding="utf-8") as f:
-            json.dump(progress, f, ensure_ascii=False, indent=2)
+        ProgressJournal.write_snapshot(cp_data_path, progress)
+
+        return progress, doc
+
+    async def parse_chapter(self, file_path):
+        if self.low_memory:
+            path = await asyncio.to_thread(self.archive.materialize, file_path)
+            return await asyncio.to_thread(ChapterIndex.scan, path)
+
+        if self.executor is None:
+            return ChapterDocument.parse(self.archive.read(file_path))
 
-        return progress, p_tags
+        data = await asyncio.to_thread(self.archive.read, file_path)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, summarize_chapter, data, self.prefilter)
 
+    @timed("update_chapter_process")
     async def update_chapter_process(self, file_path, idx, translated_text):
-        file_name = os.path.basename(file_path)
-        cp_data_path = os.path.join(self.extract_dir, f"{file_name}.cp_data")
+        cp_data_path = self.cp_data_path(file_path)
 
         if not os.path.exists(cp_data_path):
-            logger.error(f"{file_name} 进度异常！")
+            logger.error(f"{os.path.basename(file_path)} 进度异常！")
             exit(1)
 
-        async with self.lock:
-            progress = {}
-            if os.path.exists(cp_data_path):
-                with open(cp_data_path, "r", encoding="utf-8") as f:
-                    progress = json.load(f)
-
-            progress[str(idx)] = translated_text
-
-            with open(cp_data_path, "w", encoding="utf-8") as f:
-                json.dump(progress, f, ensure_ascii=False, indent=2)
+        # 只追加一条记录，由 journal 的写入任务批量提交；不等待落盘，
+        # 回填前 load_chapter_process 会先 flush，崩溃时最多丢失最后一批记录
+        await self.journal.append(cp_data_path, idx, translated_text)
+        registry.inc("epub_paragraphs_total")
+
+    def plan_units(self, start, end, doc, progress):
+        """把 [start, end) 中未翻译的段落划分为请求单元：
+        未开启批量时每段一个单元；开启后连续段落按 token 预算打包，单段超出预算时独占一批
+        """
+        if self.batch_tokens <= 0:
+            return [[i] for i in range(start, end) if len(progress.get(str(i), "")) == 0]
+
+        batches, batch, used = [], [], 0
+        for i in range(start, end):
+            if len(progress.get(str(i), "")) != 0:
+                if batch:
+                    batches.append(batch)
+                batch, used = [], 0
+                continue
 
-    async def do_trans(
-        self, start, end, p_tags, progress, file_path, translate_ai, position
-    ):
-        if start >= end:
-            return
+            source = doc.source(i)
+            if self.splitter is not None and self.splitter.oversized(source):
+                # 需要拆分的段落单独成一个单元
+                if batch:
+                    batches.append(batch)
+                batches.append([i])
+                batch, used = [], 0
+                continue
 
-        for i in tqdm(
-            range(start, end),
-            desc=os.path.basename(file_path)[:10] + f"[{start:03}:{end:03}]",
-            position=position,
-            ncols=80,
-            leave=True,
-        ):
+            tokens = estimate_tokens(source)
+            if batch and used + tokens > self.batch_tokens:
+                batches.append(batch)
+                batch, used = [], 0
+            batch.append(i)
+            used += tokens
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def unit_tokens(self, doc, unit):
+        return sum(estimate_tokens(doc.source(i)) for i in unit)
+
+    def schedule_units(self, doc, progress):
+        """返回 [(预估 token, 单元)]：只包含仍未翻译的段落，按 token 从大到小排列"""
+        units = self.plan_units(0, len(doc), doc, progress)
+        return longest_first([(self.unit_tokens(doc, unit), unit) for unit in units])
+
+    async def translate_segments(self, file_path, indices, doc, translate_ai):
+        """翻译一批段落；译文的分段标记对不上时二分后分别重试"""
+        texts = [doc.source(i) for i in indices]
+        if len(indices) == 1:
+            results = [await self.translate_paragraph(texts[0], translate_ai)]
+        else:
             try:
-                if len(progress.get(str(i), "")) != 0:
-                    continue
-
-                text = str(p_tags[i])
-                translated_text = await translate_ai(text)
-                await self.update_chapter_process(file_path, i, translated_text)
-            except KeyboardInterrupt as e:
-                tqdm.write(f"\n用户手动终止！")
-                exit(1)
-
+                with RequestTimer() as timer:
+                    results = await translate_ai.translate_batch(texts)
+                self.observe_output(results, timer)
+            except BatchMismatchError as e:
+                logger.warning(f"{os.path.basename(file_path)} 批量译文拆分失败({e})，二分重试")
+                mid = len(indices) // 2
+                await self.translate_segments(file_path, indices[:mid], doc, translate_ai)
+                await self.translate_segments(file_path, indices[mid:], doc, translate_ai)
+                return
+
+        await asyncio.gather(
+            *(
+                self.update_chapter_process(file_path, i, translated)
+                for i, translated in zip(indices, results)
+            )
+        )
+
+    def observe_output(self, results, timer):
+        """按实测的输出速度调整拆分阈值；只计请求本身的耗时，命中翻译记忆等未发出请求的情况不计入"""
+        if self.splitter is not None and timer.seconds is not None:
+            self.splitter.observe(sum(estimate_tokens(r) for r in results), timer.seconds)
+
+    async def translate_paragraph(self, text, translate_ai):
+        """单段翻译；超过拆分阈值时按句子/行内标签切开并发请求，译文拼回一段"""
+        pieces = self.splitter.split(text) if self.splitter is not None else [text]
+        if len(pieces) == 1:
+            with RequestTimer() as timer:
+                result = await translate_ai(text)
+            self.observe_output([result], timer)
+            return result
+
+        registry.inc("epub_paragraph_splits_total")
+        registry.inc("epub_paragraph_split_pieces_total", len(pieces))
+        results = await asyncio.gather(*(translate_ai(piece) for piece in pieces))
+        return self.splitter.stitch(text, results)
+
+    @timed("apply_progress_to_file")
     async def apply_progress_to_file(self, file_path):
 
-        progress, _ = await self.load_chapter_process(file_path)
+        progress, doc = await self.load_chapter_process(file_path)
+        # 回填后文档已被修改，不再缓存
+        self.documents.pop(file_path, None)
 
-        if len(progress) < 1 or progress is None:
+        if progress is None or len(progress) < 1:
             logger.warning(f"{file_path}无内容！")
             return False
 
-        if not os.path.exists(file_path):
+        if not self.exists(file_path):
             logger.error(f"{file_path} 目标文件不存在")
             return False
 
-        p_tags = []
-
-        with open(file_path, "r", encoding="utf-8") as fp:
-            soup = BeautifulSoup(fp, "html.parser")
-            for p in soup.find_all("p"):
-                if "__trans__" in p.get("class", []):
-                    tqdm.write(f"{file_path} 已翻译完成，跳过！")
-                    return False
-
-                if len(p.get_text(strip=True)) > 1:
-                    p_tags.append(p)
-
         logging.info(f"应用 progress 更新 {file_path}, 共 {len(progress)} 条翻译")
+        # 只保存真正的译文：foo 等占位输出不进入跨版本译文库
+        translator = self.translate_apis[0] if self.translate_apis else None
+        if self.edition is not None and translator is not None and not is_placeholder(translator):
+            pairs = [
+                (self.edition.paragraph_hash(doc.source(int(k))), v)
+                for k, v in progress.items()
+                if v.strip() and v.strip() != SKIPPED and 0 <= int(k) < len(doc)
+            ]
+            await asyncio.to_thread(self.edition.record, self.book_id, pairs, model_key(translator))
+
+        # 写入备份文件（免解压模式下章节目录可能还不存在）
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        if self.low_memory:
+            translations = {int(k): v for k, v in progress.items() if v.strip()}
+            if len(translations) < len(progress):
+                logging.warning(f"{file_path} 有 {len(progress) - len(translations)} 段无翻译内容，跳过")
+            await asyncio.to_thread(doc.apply, translations, f"{file_path}.bak")
+            logging.info(f"{file_path}.bak 已更新")
+            return True
+
+        if self.executor is not None:
+            translations = {int(k): v for k, v in progress.items() if v.strip()}
+            if len(translations) < len(progress):
+                logging.warning(f"{file_path} 有 {len(progress) - len(translations)} 段无翻译内容，跳过")
+            data = await asyncio.to_thread(self.archive.read, file_path)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, apply_chapter, data, translations, f"{file_path}.bak")
+            logging.info(f"{file_path}.bak 已更新")
+            return True
+
         for idx_str, translated in progress.items():
             idx = int(idx_str)
-            if idx < 0 or idx >= len(p_tags):
+            if idx < 0 or idx >= len(doc):
                 logging.warning(f"索引 {idx} 超出范围，跳过")
                 continue
 
@@ -258,78 +502,132 @@ class Checkpoint:
                 logging.warning(f"progress[{idx}] 无翻译内容，跳过")
                 continue
 
-            # 创建 <div class="trans"> 包裹翻译内容
-            trans_div = soup.new_tag("p", **{"class": "__trans__"})
-            frag = BeautifulSoup(translated, "html.parser")
-            trans_div.append(frag)
+            # 用 <p class="__trans__"> 包裹翻译内容，插入到原 p 标签之后
+            doc.insert_translation(idx, translated)
 
-            # 插入到原 p 标签之后
-            p_tags[idx].insert_after(trans_div)
-
-        # 写入备份文件
-        Path(f"{file_path}.bak").write_text(str(soup), encoding="utf-8")
+        Path(f"{file_path}.bak").write_bytes(doc.serialize())
         logging.info(f"{file_path}.bak 已更新")
         return True
 
-    async def translate_epub(self, file_path, task_num):
+    async def prepare_chapter(self, file_path):
+        """载入待翻译章节，返回 (progress, doc)；已完成、异常或无内容的章节返回 (None, None)"""
         self.load()
         files = self.data.get("files", [])
         if len(files) == 0:
-            return
+            return None, None
 
         if self.data["files"].get(file_path, True):
             logger.info(f"{file_path}已翻译。")
-            return
+            return None, None
 
-        progress, p_tags = await self.load_chapter_process(file_path)
+        progress, doc = await self.load_chapter_process(file_path)
 
-        if progress is None or p_tags is None:
+        if progress is None or doc is None:
             logger.warning(f"{file_path}内容异常（不存在或者已翻译）！")
             self.complete_chapter(file_path)
-            return
+            return None, None
 
-        total = len(p_tags)
-        if len(progress) < 1 or total < 1:
+        if len(progress) < 1 or len(doc) < 1:
             logger.warning(f"{file_path}无内容！")
-            return
+            self.documents.pop(file_path, None)
+            return None, None
 
-        chunk_size = math.ceil(total / task_num)
-
-        tasks = []
-        for t in range(task_num):
-            start = t * chunk_size
-            end = min((t + 1) * chunk_size, total)
-            tasks.append(
-                asyncio.create_task(
-                    self.do_trans(
-                        start,
-                        end,
-                        p_tags,
-                        progress,
-                        file_path,
-                        self.translate_apis[0],
-                        t,
-                    )
-                )
-            )
+        if self.edition is not None:
+            await self.apply_edition(file_path, doc, progress)
+        if self.prefilter is not None:
+            await self.apply_prefilter(file_path, doc, progress)
 
-        try:
-            await asyncio.gather(*tasks)
-        except Exception as e:
-            logger.error(e)
-            tqdm.write(f"处理:{file_path}出现错误，已跳过")
+        return progress, doc
+
+    async def apply_edition(self, file_path, doc, progress):
+        """从旧版本的译文中补齐内容未变的段落（不论它们在哪个文件、第几段）"""
+        pending = [idx for idx in range(len(doc)) if len(progress.get(str(idx), "")) == 0]
+        if not pending:
             return
-        except KeyboardInterrupt:
-            logger.warning("任务终止：用户手动停止")
-            tqdm.write("任务终止：用户手动停止")
-            exit(1)
+        hashes = {idx: self.edition.paragraph_hash(doc.source(idx)) for idx in pending}
+        found = await asyncio.to_thread(self.edition.lookup, self.book_id, set(hashes.values()))
+        carried = 0
+        for idx, digest in hashes.items():
+            translated = found.get(digest)
+            if translated:
+                progress[str(idx)] = translated
+                await self.update_chapter_process(file_path, idx, translated)
+                carried += 1
+        if carried:
+            registry.inc("epub_edition_carried_total", carried)
+            logger.info(f"{os.path.basename(file_path)} 沿用旧版本译文 {carried} 段")
+
+    async def apply_prefilter(self, file_path, doc, progress):
+        """本地判定无需翻译的段落，结果与模型的约定一致（<br/>）并写入进度"""
+        resolved = self.prefilter.apply(doc, progress)
+        if not resolved:
+            return
+        for idx in resolved:
+            progress[str(idx)] = SKIPPED
+            await self.update_chapter_process(file_path, idx, SKIPPED)
+        logger.info(f"{os.path.basename(file_path)} 预过滤跳过 {len(resolved)} 段")
 
+    async def finish_chapter(self, file_path):
         # 翻译失败只保存进度，不应用翻译，保证源文件的纯净
         is_ok = await self.apply_progress_to_file(file_path)
         if is_ok:
             self.complete_chapter(file_path)
             shutil.move(f"{file_path}.bak", file_path)
             tqdm.write(f"{file_path} 翻译完成！")
+            if self.publisher is not None:
+                try:
+                    await asyncio.to_thread(self.publisher.refresh, file_path)
+                except Exception as e:
+                    logger.error(f"发布 {file_path} 失败: {e}")
         else:
             tqdm.write(f"{file_path} 翻译失败！")
             logger.warning(f"{file_path}，翻译失败！")
+        return is_ok
+
+    async def translate_epub(self, file_path, task_num):
+        """单章翻译：未完成的请求单元按预估 token 从大到小进入共享队列，task_num 个工作协程依次领取，
+        直到队列取空（续译或段落长短不均时也不会有协程提前闲置）
+        """
+        progress, doc = await self.prepare_chapter(file_path)
+        if progress is None:
+            return
+
+        units = self.schedule_units(doc, progress)
+        queue = asyncio.Queue()
+        for entry in units:
+            queue.put_nowait(entry)
+
+        total = len(doc)
+        pending = sum(len(unit) for _, unit in units)
+        with tqdm(
+            total=total,
+            initial=total - pending,
+            desc=os.path.basename(file_path)[:20],
+            ncols=80,
+            leave=True,
+        ) as bar, WorkerBoard(task_num) as board:
+
+            async def worker(n):
+                while not queue.empty():
+                    tokens, unit = queue.get_nowait()
+                    board.start(n, file_path, unit, tokens)
+                    await self.translate_segments(file_path, unit, doc, self.translate_apis[0])
+                    board.finish(n)
+                    bar.update(len(unit))
+
+            tasks = [asyncio.create_task(worker(n)) for n in range(task_num)]
+            try:
+                await asyncio.gather(*tasks)
+            except Exception as e:
+                for task in tasks:
+                    task.cancel()
+                logger.error(e)
+                tqdm.write(f"处理:{file_path}出现错误，已跳过")
+                self.documents.pop(file_path, None)
+                return
+            except KeyboardInterrupt:
+                logger.warning("任务终止：用户手动停止")
+                tqdm.write("任务终止：用户手动停止")
+                exit(1)
+
+        await self.finish_chapter(file_path)
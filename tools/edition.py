@@ -0,0 +1,90 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_spaces = re.compile(r"\s+")
+_id_attr = re.compile(r'\s+id="[^"]*"')
+
+
+class EditionStore:
+    """按 (书标识, 段落内容哈希) 保存译文，新版本的书只需翻译新增或改动的段落
+
+    段落哈希基于规范化的段落源码：合并空白，去掉 id 属性（新版本常常整体重新编号）；
+    每条译文记录产生它的模型，查询时忽略没有模型记录的条目（早期版本可能存入了 foo 等占位输出）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.carried = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS paragraphs (
+                book_id TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                model TEXT,
+                updated REAL,
+                PRIMARY KEY (book_id, hash)
+            )"""
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(paragraphs)")}
+        if "model" not in columns:
+            self.conn.execute("ALTER TABLE paragraphs ADD COLUMN model TEXT")
+        self.conn.commit()
+
+    @staticmethod
+    def paragraph_hash(source):
+        normalized = _spaces.sub(" ", _id_attr.sub("", source)).strip()
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def lookup(self, book_id, hashes):
+        """返回 {哈希: 译文}，只包含找到的段落"""
+        hashes = list(hashes)
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start : start + 500]
+                rows = self.conn.execute(
+                    f"SELECT hash, translation FROM paragraphs WHERE book_id = ? AND model IS NOT NULL "
+                    f"AND hash IN ({','.join('?' * len(chunk))})",
+                    [book_id, *chunk],
+                )
+                found.update(rows)
+        self.carried += len(found)
+        return found
+
+    def record(self, book_id, pairs, model):
+        """保存一章的 (哈希, 译文)，model 为产生译文的模型标识"""
+        if not pairs:
+            return
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO paragraphs (book_id, hash, translation, model, updated) VALUES (?, ?, ?, ?, ?)",
+                [(book_id, digest, translation, model, now) for digest, translation in pairs],
+            )
+            self.conn.commit()
+        self.recorded += len(pairs)
+
+    def stats(self):
+        with self._lock:
+            books, entries = self.conn.execute(
+                "SELECT COUNT(DISTINCT book_id), COUNT(*) FROM paragraphs"
+            ).fetchone()
+        return {"books": books, "entries": entries, "carried": self.carried, "recorded": self.recorded}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -1,11 +1,60 @@
 import zipfile
 import os
+import copy
+import time
+import zlib
+import struct
 import shutil
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+from .metrics import timed
 
 logger = logging.getLogger(__name__)
 
+SKIP_SUFFIXES = (".cp_data", ".cp_log", ".tmp", ".bak", ".epub")
+
+
+class EpubArchive:
+    """不解压直接读取 EPUB：工作目录作为覆盖层，存在的文件读磁盘，其余按需从压缩包读取"""
+
+    def __init__(self, epub_path, overlay_dir):
+        self.zf = zipfile.ZipFile(epub_path, 'r')
+        self.overlay_dir = overlay_dir
+        self.names = set(self.zf.namelist())
+
+    def member(self, path):
+        return os.path.relpath(path, self.overlay_dir).replace(os.sep, "/")
+
+    def exists(self, path):
+        return os.path.exists(path) or self.member(path) in self.names
+
+    def open(self, path):
+        if os.path.exists(path):
+            return open(path, "rb")
+        return self.zf.open(self.member(path))
+
+    def read(self, path):
+        with self.open(path) as f:
+            return f.read()
+
+    def materialize(self, path):
+        """确保文件在工作目录中存在（流式解出，不整体读入内存），修改时间与压缩包一致"""
+        if os.path.exists(path):
+            return path
+        info = self.zf.getinfo(self.member(path))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.zf.open(info) as src, open(f"{path}.tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(f"{path}.tmp", path)
+        ts = EpubTool._zip_time(info)
+        os.utime(path, (ts, ts))
+        return path
+
+    def close(self):
+        self.zf.close()
+
+
 class EpubTool:
     @staticmethod
     def extract(epub_path, extract_to, clean=False):
@@ -25,35 +74,184 @@ class EpubTool:
 
         with zipfile.ZipFile(epub_path, 'r') as zf:
             zf.extractall(extract_to)
+            # 文件时间设为压缩包内记录的时间，打包时据此判断文件是否被修改过
+            for info in zf.infolist():
+                file_path = os.path.join(extract_to, info.filename)
+                if not info.is_dir() and os.path.isfile(file_path):
+                    ts = EpubTool._zip_time(info)
+                    os.utime(file_path, (ts, ts))
 
         tqdm.write(f"解压完成: {extract_to}")
 
     @staticmethod
-    def package_epub(cp , clean=False):
-        output_name = os.path.join(cp.extract_dir, '..', '..', f"bi_{cp.file_name}")
+    def _zip_time(info):
+        return time.mktime(info.date_time + (0, 0, -1))
+
+    @staticmethod
+    def _is_unchanged(file_path, info):
+        """按 大小/修改时间/CRC 判断解压出的文件是否与原压缩包中的一致"""
+        stat = os.stat(file_path)
+        if stat.st_size != info.file_size:
+            return False
+        if abs(stat.st_mtime - EpubTool._zip_time(info)) < 2:
+            return True
+
+        crc = 0
+        with open(file_path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                crc = zlib.crc32(chunk, crc)
+        return crc == info.CRC
+
+    @staticmethod
+    def _read_raw(src, info):
+        """读取成员压缩后的原始字节（跳过本地文件头）"""
+        src.fp.seek(info.header_offset)
+        header = src.fp.read(30)
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        src.fp.seek(info.header_offset + 30 + name_len + extra_len)
+        return src.fp.read(info.compress_size)
+
+    @staticmethod
+    def _write_raw(zf, zinfo, raw):
+        """把已压缩好的数据直接写入输出压缩包，不再重新压缩"""
+        zinfo.header_offset = zf.fp.tell()
+        zf.fp.write(zinfo.FileHeader())
+        zf.fp.write(raw)
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+        zf.start_dir = zf.fp.tell()
+        zf._didModify = True
+
+    @staticmethod
+    def _deflate(file_path, rel_path):
+        with open(file_path, "rb") as f:
+            data = f.read()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        raw = compressor.compress(data) + compressor.flush()
+
+        zinfo = zipfile.ZipInfo(
+            rel_path, time.localtime(os.path.getmtime(file_path))[:6]
+        )
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = 0o644 << 16
+        zinfo.file_size = len(data)
+        zinfo.compress_size = len(raw)
+        zinfo.CRC = zlib.crc32(data)
+        return zinfo, raw
+
+    @staticmethod
+    def _collect_files(extract_dir):
+        files = {}
+        for root, _, names in os.walk(extract_dir):
+            for file in names:
+                if file.endswith(SKIP_SUFFIXES):
+                    continue
+                file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(file_path, extract_dir).replace(os.sep, "/")
+                files[rel_path] = file_path
+        return files
+
+    @staticmethod
+    def output_path(cp):
+        return os.path.join(cp.extract_dir, '..', '..', f"bi_{cp.file_name}")
+
+    @staticmethod
+    @timed("package_epub")
+    def package_epub(cp , clean=False, workers=None):
+        """打包：未改动的文件从原 EPUB 原样拷贝压缩数据，只有改动过的文件（译后的章节）多线程重新压缩"""
+        output_name = EpubTool.output_path(cp)
 
-        with zipfile.ZipFile(output_name, 'w') as zf:
-            mimetype_path = os.path.join(cp.extract_dir, "mimetype")
-            if os.path.exists(mimetype_path):
-                zf.write(mimetype_path, "mimetype", compress_type=zipfile.ZIP_STORED)
+        files = EpubTool._collect_files(cp.extract_dir)
+        files.pop("mimetype", None)
 
-            for root, _, files in os.walk(cp.extract_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(file_path, cp.extract_dir)
+        src = zipfile.ZipFile(cp.epub_path, 'r') if os.path.exists(cp.epub_path) else None
+        sources = {}
+        if src is not None:
+            for info in src.infolist():
+                if info.filename != "mimetype" and not info.is_dir():
+                    sources[info.filename] = info
 
-                    if rel_path == "mimetype":
-                        continue
-                    if file.endswith(".cp_data"):
-                        continue
-                    
-                    if file.endswith(".epub"):
-                        continue
-                    
-                    zf.write(file_path, rel_path, compress_type=zipfile.ZIP_DEFLATED)
+        # 原书中的文件保持原顺序，新增文件排在最后；工作目录中没有的文件（免解压模式）直接取原书
+        order = list(sources) + [rel for rel in files if rel not in sources]
+        changed = [
+            rel for rel in files
+            if rel not in sources or not EpubTool._is_unchanged(files[rel], sources[rel])
+        ]
 
+        with ThreadPoolExecutor(max_workers=workers) as pool, zipfile.ZipFile(output_name, 'w') as zf:
+            # mimetype 必须是第一个且不压缩
+            zf.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+
+            compressed = {rel: pool.submit(EpubTool._deflate, files[rel], rel) for rel in changed}
+            for rel in order:
+                if rel in compressed:
+                    zinfo, raw = compressed[rel].result()
+                else:
+                    info = sources[rel]
+                    zinfo = copy.copy(info)
+                    zinfo.flag_bits &= ~0x08  # 大小与 CRC 已写入本地文件头，不需要数据描述符
+                    zinfo.extra = b""
+                    raw = EpubTool._read_raw(src, info)
+                EpubTool._write_raw(zf, zinfo, raw)
+
+        if src is not None:
+            src.close()
+
+        logger.info(f"打包: 原样拷贝 {len(order) - len(changed)} 个文件，重新压缩 {len(changed)} 个文件")
         tqdm.write(f"EPUB 打包完成: {output_name}\n")
 
         if clean:
             shutil.rmtree(cp.extract_dir)
-            logger.warning(f"清空目录: {cp.extract_dir}")
\ No newline at end of file
+            logger.warning(f"清空目录: {cp.extract_dir}")
+
+
+class EpubPublisher:
+    """边翻译边发布：每完成一章就更新 bi_<书名>.epub，随时都有一份可阅读的部分译本
+
+    每次运行的第一次发布都完整打包（已有的输出文件可能来自之前的运行或旧版本的书）；之后以追加模式打开输出文件，从中央目录删掉旧条目，
+    只把改动的章节压缩后追加到末尾，耗时与该章大小成正比。被替换的旧数据留在文件中，
+    超过有效数据量时整本重新打包回收空间；输出文件损坏（如追加时进程被杀）同样整本重建
+    """
+
+    def __init__(self, cp):
+        self.cp = cp
+        self.output_name = EpubTool.output_path(cp)
+        self.refreshed = 0
+        self.rebuilt = 0
+
+    def rebuild(self):
+        EpubTool.package_epub(self.cp)
+        self.rebuilt += 1
+
+    @staticmethod
+    def _garbage(zf):
+        live = sum(30 + len(info.orig_filename.encode("utf-8")) + len(info.extra) + info.compress_size for info in zf.filelist)
+        return zf.start_dir - live, live
+
+    @timed("publish_chapter")
+    def refresh(self, *file_paths):
+        """把改动过的章节写入输出文件（file_paths 为工作目录中的路径）"""
+        if not self.rebuilt or not os.path.exists(self.output_name):
+            self.rebuild()
+            return
+
+        try:
+            with zipfile.ZipFile(self.output_name, "a") as zf:
+                for file_path in file_paths:
+                    rel = os.path.relpath(file_path, self.cp.extract_dir).replace(os.sep, "/")
+                    old = zf.NameToInfo.pop(rel, None)
+                    if old is not None:
+                        zf.filelist.remove(old)
+                    zinfo, raw = EpubTool._deflate(file_path, rel)
+                    zf.fp.seek(zf.start_dir)
+                    EpubTool._write_raw(zf, zinfo, raw)
+                garbage, live = self._garbage(zf)
+        except (zipfile.BadZipFile, OSError, EOFError) as e:
+            logger.warning(f"{self.output_name} 已损坏，重新打包: {e}")
+            self.rebuild()
+            return
+
+        self.refreshed += len(file_paths)
+        if garbage > live:
+            logger.info(f"{self.output_name} 失效数据 {garbage} 字节，重新打包回收空间")
+            self.rebuild()
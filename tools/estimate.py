@@ -0,0 +1,199 @@
+from tqdm import tqdm
+from .chapter import ChapterDocument
+from .journal import ProgressJournal
+from .prefilter import SKIPPED
+from translators.base_api import estimate_tokens, join_segments, prompt
+from translators.profiles import profile_env
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 美元 / 百万 token（输入, 输出），可用 .env 的 {prefix}PRICE_IN / {prefix}PRICE_OUT 覆盖
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "deepseek-chat": (0.27, 1.10),
+    "qwen-plus": (0.40, 1.20),
+}
+
+# 每次请求的消息封装开销（role、分隔符等）
+CHAT_OVERHEAD = 8
+# 英译中时译文 token 数与原文之比（含保留的 HTML 标签）
+OUTPUT_RATIO = 1.2
+
+
+def make_counter(model):
+    """优先使用 tiktoken 精确计数，未安装或没有对应编码时退回粗略估算"""
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens, "estimate"
+
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model or "")
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # 编码文件需要联网下载，离线时同样退回估算
+        logger.warning(f"tiktoken 不可用，改用粗略估算: {e}")
+        return estimate_tokens, "estimate"
+    return (lambda text: len(encoding.encode(text, disallowed_special=()))), f"tiktoken:{encoding.name}"
+
+
+class ChapterEstimate:
+    def __init__(self, name):
+        self.name = name
+        self.paragraphs = 0
+        self.pending = 0
+        self.skipped = 0
+        self.splits = 0
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.outputs = []
+
+
+class Estimator:
+    """不调用任何 API，按当前的批量/预过滤设置统计每章的请求数与 token 数，并估算费用与耗时"""
+
+    def __init__(self, providers, tasks, prefilter=None, count=estimate_tokens):
+        self.providers = providers
+        self.tasks = tasks
+        self.prefilter = prefilter
+        self.count = count
+        self.prompt_tokens = count(prompt)
+
+    @staticmethod
+    def provider_settings(name):
+        """读取某个服务的模型、价格、限流与延迟设置"""
+        if name == "foo":
+            return dict(model="foo", price=(0, 0), rpm=0, tpm=0, concurrency=16, latency=0.2, tps=0)
+        model = profile_env(name, "MODEL", "")
+        price_in, price_out = PRICES.get(model, (0, 0))
+        return dict(
+            model=model,
+            price=(
+                float(profile_env(name, "PRICE_IN", price_in)),
+                float(profile_env(name, "PRICE_OUT", price_out)),
+            ),
+            rpm=int(profile_env(name, "API_RPM", 0)),
+            tpm=int(profile_env(name, "API_TPM", 0)),
+            concurrency=int(profile_env(name, "API_CONCURRENCY", 16)),
+            # 首 token 延迟与单流输出速度，用于估算单次请求耗时
+            latency=float(profile_env(name, "LATENCY", 1.0)),
+            tps=float(profile_env(name, "OUTPUT_TPS", 50)),
+        )
+
+    def chapter(self, cp, file_path):
+        est = ChapterEstimate(os.path.basename(file_path))
+        doc = ChapterDocument.parse(cp.archive.read(file_path))
+        if doc.translated:
+            return est
+
+        est.paragraphs = len(doc)
+        cp_data_path = cp.cp_data_path(file_path)
+        progress = ProgressJournal.load(cp_data_path) if os.path.exists(cp_data_path) else {}
+        progress = dict(progress)
+
+        for idx in range(len(doc)):
+            if len(progress.get(str(idx), "")) != 0:
+                continue
+            if self.prefilter is not None and self.prefilter.classify(doc.paragraphs[idx]) is not None:
+                progress[str(idx)] = SKIPPED
+                est.skipped += 1
+                continue
+            est.pending += 1
+
+        for unit in cp.plan_units(0, len(doc), doc, progress):
+            texts = [doc.source(i) for i in unit]
+            if len(texts) > 1:
+                bodies = [join_segments(texts)]
+            elif cp.splitter is not None:
+                # 超长段落拆成多个请求，每个请求都带完整的系统提示
+                bodies = cp.splitter.split(texts[0])
+                est.splits += len(bodies) > 1
+            else:
+                bodies = texts
+            for body in bodies:
+                source_tokens = self.count(body)
+                output_tokens = int(source_tokens * OUTPUT_RATIO)
+                est.requests += 1
+                est.input_tokens += self.prompt_tokens + source_tokens + CHAT_OVERHEAD
+                est.output_tokens += output_tokens
+                est.outputs.append(output_tokens)
+        return est
+
+    def wall_time(self, chapters, settings):
+        """按并发、RPM、TPM 三者中最紧的一个估算耗时（秒）"""
+        latencies = [
+            settings["latency"] + (tokens / settings["tps"] if settings["tps"] else 0)
+            for c in chapters
+            for tokens in c.outputs
+        ]
+        if not latencies:
+            return 0.0
+        requests = len(latencies)
+        tokens = sum(c.input_tokens + c.output_tokens for c in chapters)
+        concurrency = max(1, min(self.tasks, settings["concurrency"]))
+        bounds = [sum(latencies) / concurrency, max(latencies)]
+        if settings["rpm"]:
+            bounds.append(requests / settings["rpm"] * 60)
+        if settings["tpm"]:
+            bounds.append(tokens / settings["tpm"] * 60)
+        return max(bounds)
+
+    def run(self, cp):
+        chapters = []
+        for file_path in cp.get_next_file():
+            if cp.data["files"].get(file_path) or not cp.exists(file_path):
+                continue
+            chapters.append(self.chapter(cp, file_path))
+        return chapters
+
+    def report(self, book, chapters, tokenizer):
+        lines = [f"[{book}] 分词: {tokenizer}, 系统提示 {self.prompt_tokens} tokens"]
+        lines.append(f"{'章节':<24}{'段落':>7}{'待译':>7}{'跳过':>7}{'拆分':>7}{'请求':>7}{'输入':>10}{'输出':>10}")
+        for c in chapters:
+            lines.append(
+                f"{c.name[:24]:<24}{c.paragraphs:>7}{c.pending:>7}{c.skipped:>7}{c.splits:>7}"
+                f"{c.requests:>7}{c.input_tokens:>10}{c.output_tokens:>10}"
+            )
+        total_in = sum(c.input_tokens for c in chapters)
+        total_out = sum(c.output_tokens for c in chapters)
+        lines.append(
+            f"{'合计':<24}{sum(c.paragraphs for c in chapters):>7}{sum(c.pending for c in chapters):>7}"
+            f"{sum(c.skipped for c in chapters):>7}{sum(c.splits for c in chapters):>7}"
+            f"{sum(c.requests for c in chapters):>7}"
+            f"{total_in:>10}{total_out:>10}"
+        )
+
+        rates = []
+        for name in self.providers:
+            settings = self.provider_settings(name)
+            seconds = self.wall_time(chapters, settings)
+            cost = (total_in * settings["price"][0] + total_out * settings["price"][1]) / 1_000_000
+            price = "未知价格" if settings["price"] == (0, 0) and name != "foo" else f"${cost:.2f}"
+            lines.append(
+                f"  全部由 {name}({settings['model'] or '-'}) 处理: {price}, "
+                f"约 {seconds / 60:.1f} 分钟 (并发 {min(self.tasks, settings['concurrency'])})"
+            )
+            if seconds:
+                rates.append(1 / seconds)
+        if len(rates) > 1:
+            lines.append(f"  多个服务同时分担: 约 {1 / sum(rates) / 60:.1f} 分钟")
+        return "\n".join(lines)
+
+
+def estimate_books(checkpoints, providers, tasks, prefilter=None):
+    count, tokenizer = make_counter(Estimator.provider_settings(providers[0])["model"])
+    estimator = Estimator(providers, tasks, prefilter, count)
+    for cp in checkpoints:
+        text = estimator.report(cp.file_name, estimator.run(cp), tokenizer)
+        logger.info(text)
+        tqdm.write(text)
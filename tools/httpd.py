@@ -0,0 +1,82 @@
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import json
+import logging
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path
+        self.query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b"{}")
+
+
+def _encode(body):
+    if isinstance(body, (dict, list)):
+        return json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json"
+    if isinstance(body, str):
+        return body.encode("utf-8"), "text/plain; charset=utf-8"
+    return body or b"", "application/octet-stream"
+
+
+async def _handle_connection(handler, reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length", 0))
+            body = await reader.readexactly(length) if length else b""
+
+            try:
+                status, extra_headers, payload = await handler(
+                    Request(method, target, headers, body)
+                )
+            except Exception as e:
+                logger.error(f"请求处理失败: {e}")
+                status, extra_headers, payload = 500, {}, {"error": str(e)}
+
+            data, content_type = _encode(payload)
+            head = [
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                f"Content-Type: {content_type}",
+                f"Content-Length: {len(data)}",
+            ]
+            head += [f"{k}: {v}" for k, v in (extra_headers or {}).items()]
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+            await writer.drain()
+
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(handler, host="127.0.0.1", port=0, unix_path=None):
+    """启动一个极简的 HTTP/1.1 服务（支持 keep-alive），handler(request) 返回 (状态码, 响应头, 响应体)"""
+
+    async def on_connect(reader, writer):
+        await _handle_connection(handler, reader, writer)
+
+    if unix_path:
+        return await asyncio.start_unix_server(on_connect, path=unix_path)
+    return await asyncio.start_server(on_connect, host, port)
@@ -0,0 +1,155 @@
+import os
+import json
+import logging
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+LOG_SUFFIX = ".cp_log"
+
+
+class ProgressJournal:
+    """章节进度的追加日志：每段一条记录，由后台写入任务按批（组提交）落盘
+
+    append 只负责入队、不等待落盘；需要确认已写入时调用 flush（回填章节前的读取即如此），
+    崩溃时最多丢失最后一批尚未提交的记录，这些段落在续译时重新翻译
+    """
+
+    def __init__(self, flush_records=64, flush_ms=100, fsync=False):
+        self.flush_records = max(1, flush_records)
+        self.flush_ms = flush_ms
+        self.fsync = fsync
+        self.queue = None
+        self.writer = None
+
+    @staticmethod
+    def log_path(cp_data_path):
+        return os.path.splitext(cp_data_path)[0] + LOG_SUFFIX
+
+    def _ensure_writer(self):
+        if self.writer is None or self.writer.done():
+            self.queue = asyncio.Queue()
+            self.writer = asyncio.create_task(self._write_loop())
+
+    async def append(self, cp_data_path, idx, translated_text):
+        """追加一条进度记录（只入队，由写入任务批量提交）"""
+        self._ensure_writer()
+        line = json.dumps({"i": str(idx), "t": translated_text}, ensure_ascii=False)
+        await self.queue.put((self.log_path(cp_data_path), line + "\n", None))
+
+    async def flush(self):
+        if self.writer is None or self.writer.done():
+            return
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((None, None, fut))
+        await fut
+
+    async def close(self):
+        if self.writer is None:
+            return
+        await self.flush()
+        self.writer.cancel()
+        try:
+            await self.writer
+        except asyncio.CancelledError:
+            pass
+        self.writer = None
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_ms / 1000
+            # 凑满 flush_records 条或等到 flush_ms 超时后统一提交；遇到 flush 请求立即提交
+            while len(batch) < self.flush_records and batch[-1][0] is not None:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except TimeoutError:
+                    break
+
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"进度日志写入失败: {e}")
+                for _, _, fut in batch:
+                    if fut is not None and not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            for _, _, fut in batch:
+                if fut is not None and not fut.done():
+                    fut.set_result(None)
+
+    def _write_batch(self, batch):
+        grouped = {}
+        for path, line, _ in batch:
+            if path is not None:
+                grouped.setdefault(path, []).append(line)
+
+        for path, lines in grouped.items():
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+    @staticmethod
+    def load(cp_data_path, repair=True):
+        """读取进度快照并重放追加日志；末尾被截断的记录（崩溃时写了一半）直接丢弃
+
+        repair=False 时只读：不截断日志文件，用于写入任务仍在追加时的查询
+        """
+        progress = {}
+        if os.path.exists(cp_data_path):
+            with open(cp_data_path, "r", encoding="utf-8") as f:
+                progress = json.load(f)
+
+        log_path = ProgressJournal.log_path(cp_data_path)
+        if not os.path.exists(log_path):
+            return progress
+
+        with open(log_path, "rb") as f:
+            data = f.read()
+
+        # 崩溃时可能只写了半条记录，截掉它，避免之后追加的记录与其粘连
+        if data and not data.endswith(b"\n"):
+            tail = data.rfind(b"\n") + 1
+            if repair:
+                logger.warning(f"{log_path} 末尾记录不完整，已丢弃")
+                with open(log_path, "r+b") as f:
+                    f.truncate(tail)
+            data = data[:tail]
+
+        for n, line in enumerate(data.decode("utf-8").split("\n")):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                progress[record["i"]] = record["t"]
+            except (json.JSONDecodeError, KeyError, TypeError):
+                logger.warning(f"{log_path} 第 {n + 1} 行记录损坏，已跳过")
+        return progress
+
+    @staticmethod
+    def write_snapshot(cp_data_path, progress):
+        tmp_path = f"{cp_data_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(progress, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, cp_data_path)
+
+    @staticmethod
+    def compact(cp_data_path):
+        """把追加日志合并进快照，并删除日志"""
+        log_path = ProgressJournal.log_path(cp_data_path)
+        if not os.path.exists(log_path):
+            return
+
+        progress = ProgressJournal.load(cp_data_path)
+        ProgressJournal.write_snapshot(cp_data_path, progress)
+        os.remove(log_path)
+        logger.info(f"进度日志已合并: {cp_data_path}")
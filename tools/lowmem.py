@@ -0,0 +1,201 @@
+from lxml import etree, html as lxml_html
+from .chapter import TRANS_CLASS
+
+import os
+import re
+import gc
+import sys
+import mmap
+import html
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 段落的开始/结束标签；注释、CDATA 与 <script>/<style> 整段匹配后跳过，其中的 <p> 不是段落
+_p_token = re.compile(
+    rb"<!--.*?-->|<!\[CDATA\[.*?\]\]>"
+    rb"|<(script|style)(?=[\s>/])(?:[^>]*/>|[^>]*>.*?</\1\s*>)"
+    rb"|<p(?=[\s>/])[^>]*>|</p\s*>",
+    re.S,
+)
+_tag_or_comment = re.compile(r"<!--.*?-->|<[^>]*>", re.S)
+_class_attr = re.compile(rb"""\bclass\s*=\s*["']([^"']*)["']""")
+_xml_parser = etree.XMLParser(resolve_entities=False, recover=False, no_network=True)
+
+
+def _text_len(fragment):
+    # 与 ChapterDocument 的判定一致：每个文本节点去掉首尾空白后计数
+    return sum(len(html.unescape(t).strip()) for t in _tag_or_comment.split(fragment))
+
+
+class ParagraphRecord:
+    __slots__ = ("index", "start", "end", "hash")
+
+    def __init__(self, index, start, end, digest):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.hash = digest
+
+
+class _LazyParagraphs:
+    """按需把段落源码解析成元素，供预过滤使用（没有祖先节点，CSS 类只看段落自身）"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, idx):
+        return lxml_html.fragment_fromstring(self.index.source(idx))
+
+    def __len__(self):
+        return len(self.index)
+
+
+class ChapterIndex:
+    """低内存模式的章节：只保存每个段落在文件中的字节区间，不持有解析树
+
+    原文按需从磁盘读取，回填时把译文按偏移拼接进原文件的流式副本
+    """
+
+    def __init__(self, file_path, records, translated):
+        self.file_path = file_path
+        self.records = records
+        self.translated = translated
+        self.paragraphs = _LazyParagraphs(self)
+
+    @classmethod
+    def scan(cls, file_path):
+        """用正则扫描章节（mmap，不整体读入内存），选段规则与 ChapterDocument 相同：
+        跳过注释、CDATA 与脚本/样式中的 <p>；嵌套的 <p> 与外层各算一段，按开始标签的顺序编号"""
+        records = []
+        translated = False
+        if os.path.getsize(file_path) == 0:
+            return cls(file_path, records, translated)
+
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            spans, opened = [], []
+            for token in _p_token.finditer(data):
+                tag = token.group(0)
+                if tag.startswith(b"</p"):
+                    if opened:
+                        spans.append((opened.pop(), token.end()))
+                    continue
+                if not tag.startswith(b"<p"):
+                    continue
+                classes = _class_attr.search(tag)
+                if classes and TRANS_CLASS.encode() in classes.group(1).split():
+                    translated = True
+                    break
+                if not tag.endswith(b"/>"):
+                    opened.append(token.start())
+
+            for start, end in sorted(spans):
+                chunk = data[start:end]
+                if _text_len(chunk.decode("utf-8", "replace")) > 1:
+                    digest = hashlib.blake2b(chunk, digest_size=8).digest()
+                    records.append(ParagraphRecord(len(records), start, end, digest))
+
+        return cls(file_path, records, translated)
+
+    def __len__(self):
+        return len(self.records)
+
+    def source(self, idx):
+        record = self.records[idx]
+        with open(self.file_path, "rb") as f:
+            f.seek(record.start)
+            chunk = f.read(record.end - record.start)
+        if hashlib.blake2b(chunk, digest_size=8).digest() != record.hash:
+            raise RuntimeError(f"{self.file_path} 在翻译期间被修改")
+        return chunk.decode("utf-8")
+
+    @staticmethod
+    def _fragment(translated):
+        """译文转成可直接拼进 XHTML 的片段：合法 XML 原样使用，否则经 HTML 解析后按 XML 序列化"""
+        try:
+            etree.fromstring(f"<wrap>{translated}</wrap>", _xml_parser)
+            return translated
+        except etree.XMLSyntaxError:
+            pass
+        nodes = lxml_html.fragments_fromstring(translated)
+        parts = []
+        for node in nodes:
+            if isinstance(node, str):
+                parts.append(html.escape(node, quote=False))
+            else:
+                parts.append(etree.tostring(node, encoding="unicode", method="xml"))
+        return "".join(parts)
+
+    def apply(self, translations, out_path, block=1 << 20):
+        """把 {下标: 译文} 以 <p class="__trans__"> 插到对应段落之后，流式写出到 out_path"""
+        inserts = sorted(
+            (self.records[idx].end, idx, text)
+            for idx, text in translations.items()
+            if 0 <= idx < len(self.records)
+        )
+        with open(self.file_path, "rb") as src, open(out_path, "wb") as dst:
+            pos = 0
+            for offset, idx, text in inserts:
+                remaining = offset - pos
+                while remaining > 0:
+                    chunk = src.read(min(block, remaining))
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    remaining -= len(chunk)
+                pos = offset
+                fragment = self._fragment(text)
+                dst.write(f'<p class="{TRANS_CLASS}">{fragment}</p>'.encode("utf-8"))
+            while chunk := src.read(block):
+                dst.write(chunk)
+        return len(inserts)
+
+
+def current_rss_mb():
+    """当前常驻内存（MB）；无法读取时返回峰值，两者都不可用（如 Windows）时返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+class MemoryGuard:
+    """内存上限：超过 ceiling_mb 时暂停预读新章节，等在途章节提交、回收后再继续"""
+
+    def __init__(self, ceiling_mb):
+        self.ceiling_mb = ceiling_mb
+        self.throttled = 0
+        if ceiling_mb and current_rss_mb() is None:
+            logger.warning("无法读取本进程的内存占用，内存上限不生效")
+
+    def over(self):
+        if not self.ceiling_mb:
+            return False
+        rss = current_rss_mb()
+        return rss is not None and rss > self.ceiling_mb
+
+    async def wait(self, busy):
+        """busy() 返回是否还有在途的章节；没有在途章节时不再等待，避免卡死"""
+        if not self.over():
+            return
+        gc.collect()
+        if self.over():
+            self.throttled += 1
+            logger.warning(f"内存 {current_rss_mb():.0f}MB 超过上限 {self.ceiling_mb}MB，暂停预读")
+        while self.over() and busy():
+            await asyncio.sleep(0.2)
+            gc.collect()
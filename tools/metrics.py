@@ -0,0 +1,225 @@
+"""运行时指标：计数器 / 仪表 / 直方图 + 耗时区间，可导出为 Prometheus 文本或 JSONL"""
+
+from contextlib import contextmanager
+from functools import wraps
+
+import os
+import json
+import time
+import bisect
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 秒，覆盖从本地解析（毫秒级）到慢速 API（分钟级）的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """进程内指标表，标签以 kwargs 传入；指标在第一次使用时创建"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help = {}
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+        return "{" + body + "}"
+
+    def render_prometheus(self):
+        """Prometheus 文本格式 (0.0.4)"""
+        lines = []
+        with self.lock:
+            for kind, table in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in table}):
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (n, labels), value in sorted(table.items()):
+                        if n == name:
+                            lines.append(f"{name}{self._labels(labels)} {value}")
+
+            for name in sorted({name for name, _ in self.histograms}):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), hist in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {hist.count}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {hist.sum}")
+                    lines.append(f"{name}_count{self._labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """适合写入 JSONL 的快照：{"counters": [...], "gauges": [...], "histograms": [...]}"""
+        with self.lock:
+            return {
+                "ts": round(time.time(), 3),
+                "counters": [
+                    {"name": n, "labels": dict(l), "value": v} for (n, l), v in self.counters.items()
+                ],
+                "gauges": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self.gauges.items()],
+                "histograms": [
+                    {
+                        "name": n,
+                        "labels": dict(l),
+                        "count": h.count,
+                        "sum": round(h.sum, 6),
+                        "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.counts)),
+                    }
+                    for (n, l), h in self.histograms.items()
+                ],
+            }
+
+
+registry = Registry()
+
+registry.describe("epub_span_seconds", "各处理阶段的耗时")
+registry.describe("epub_request_seconds", "单次 API 请求耗时（含失败的尝试）")
+registry.describe("epub_requests_total", "API 请求次数，按结果分类")
+registry.describe("epub_retries_total", "API 请求重试次数")
+registry.describe("epub_tokens_total", "API 返回的 token 用量")
+registry.describe("epub_queue_wait_seconds", "请求在限流器中的排队时间")
+registry.describe("epub_in_flight", "正在进行的 API 请求数")
+registry.describe("epub_queue_depth", "在限流器中等待的请求数")
+registry.describe("epub_concurrency_limit", "限流器当前的并发上限")
+registry.describe("epub_paragraphs_total", "已写入进度的段落数")
+
+
+@contextmanager
+def span(name, **labels):
+    """记录一段代码的耗时到 epub_span_seconds{span=name}，同步/异步代码均可使用"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe("epub_span_seconds", time.perf_counter() - start, span=name, **labels)
+
+
+def timed(name):
+    """span 的装饰器形式，支持普通函数与协程函数"""
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+async def serve_metrics(port, host="127.0.0.1"):
+    """在 http://host:port/metrics 提供 Prometheus 文本"""
+    from .httpd import serve
+
+    async def handler(request):
+        if request.method == "GET" and request.path.rstrip("/") in ("", "/metrics"):
+            return 200, {}, registry.render_prometheus()
+        return 404, {}, "not found"
+
+    server = await serve(handler, host, port)
+    logger.info(f"指标服务: http://{host}:{server.sockets[0].getsockname()[1]}/metrics")
+    return server
+
+
+class JsonlExporter:
+    """每隔 interval 秒把指标快照追加到 JSONL 文件，close() 时再写一次最终快照"""
+
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval
+        self.task = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.task = asyncio.create_task(self._loop())
+
+    def write(self):
+        line = json.dumps(registry.snapshot(), ensure_ascii=False)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.to_thread(self.write)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.write()
@@ -0,0 +1,120 @@
+from .metrics import registry
+
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 与提示词约定一致：不需要翻译的段落由模型输出 <br/>，本地判定时也记录同样的结果
+SKIPPED = "<br/>"
+
+DEFAULT_CLASSES = ("programlisting", "screen", "code", "pre", "console")
+CODE_TAGS = {"code", "kbd", "samp", "tt", "pre", "var"}
+
+_cjk = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+_letter = re.compile(r"[^\W\d_]")
+_numeric = re.compile(r"^[\d\s\W_]*$")
+_shell = re.compile(r"^\s*(?:[$#%>]|>>>)\s+\S")
+_code_symbols = re.compile(r"[{}\[\]();=<>\\|&*/+\-_:.,'\"`]")
+_code_tokens = re.compile(r"(?:==|!=|->|=>|::|\+\+|&&|\|\||\w+\(\)|\w+\.\w+\(|;\s*$)")
+
+
+def _localname(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else None
+
+
+class Prefilter:
+    """在段落发往 API 之前做本地判定，命中规则的段落直接记录为 SKIPPED
+
+    - CSS 类：段落或其祖先带有 skip_classes 中的类（如 programlisting）
+    - 代码：文本全部位于 <code>/<kbd> 等标签内，或是符号密度很高的代码行；
+      以 shell 提示符（$ # % > >>>）开头的段落只在位于代码标签内或含有代码记号时才算代码，
+      避免误伤以 "# of"、"> 引文" 开头的正文
+    - 纯数字/符号：页码、编号、分隔线等
+    - 已是目标语言：中文字符占字母的比例不低于 target_ratio
+    - 用户正则：对段落纯文本做 search
+    """
+
+    def __init__(self, skip_classes=DEFAULT_CLASSES, patterns=(), target_ratio=0.5, code=True):
+        self.skip_classes = set(skip_classes)
+        self.patterns = [re.compile(p) for p in patterns]
+        self.target_ratio = target_ratio
+        self.code = code
+        self.skipped = {}
+
+    @property
+    def total(self):
+        return sum(self.skipped.values())
+
+    def _has_class(self, el):
+        while el is not None and isinstance(el.tag, str):
+            if self.skip_classes & set(el.get("class", "").split()):
+                return True
+            el = el.getparent()
+        return False
+
+    @staticmethod
+    def _only_code(p):
+        if (p.text or "").strip():
+            return False
+        for child in p:
+            if _localname(child.tag) not in CODE_TAGS:
+                return False
+            if (child.tail or "").strip():
+                return False
+        return len(p) > 0
+
+    @staticmethod
+    def _in_code(p):
+        el = p.getparent()
+        while el is not None and isinstance(el.tag, str):
+            if _localname(el.tag) in CODE_TAGS:
+                return True
+            el = el.getparent()
+        return False
+
+    @staticmethod
+    def _looks_like_code(text, in_code=False):
+        if _shell.match(text) and (in_code or _code_tokens.search(text)):
+            return True
+        if len(text) < 8:
+            return False
+        symbols = len(_code_symbols.findall(text)) / len(text)
+        return symbols > 0.25 and len(_code_tokens.findall(text)) >= 2
+
+    def classify(self, p):
+        """返回跳过原因，需要翻译时返回 None"""
+        text = "".join(p.itertext()).strip()
+
+        if self.skip_classes and self._has_class(p):
+            return "class"
+        if self.code and (self._only_code(p) or self._looks_like_code(text, self._in_code(p))):
+            return "code"
+        if _numeric.match(text):
+            return "numeric"
+        if self.target_ratio:
+            letters = len(_letter.findall(text))
+            if letters and len(_cjk.findall(text)) / letters >= self.target_ratio:
+                return "target_language"
+        for pattern in self.patterns:
+            if pattern.search(text):
+                return "regex"
+        return None
+
+    def apply(self, doc, progress):
+        """判定所有未翻译的段落，返回 {下标: 原因}"""
+        resolved = {}
+        for idx in range(len(doc)):
+            if len(progress.get(str(idx), "")) != 0:
+                continue
+            if hasattr(doc, "skip_reasons"):
+                # 进程池模式：工作进程解析时已判定
+                reason = doc.skip_reasons.get(idx)
+            else:
+                reason = self.classify(doc.paragraphs[idx])
+            if reason is None:
+                continue
+            resolved[idx] = reason
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+            registry.inc("epub_prefilter_skipped_total", reason=reason)
+        return resolved
@@ -0,0 +1,173 @@
+from lxml import etree, html as lxml_html
+from .prefilter import SKIPPED
+from translators.base_api import estimate_tokens
+
+import os
+import re
+import html
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 在句末标点后的第一个空白之后切开，句间空白留在前一句上，拼接后与原文一致
+_sentence_end = re.compile(r"(?<=[.!?;:。！？；：]\s)")
+_word = re.compile(r"\S+\s*|\s+")
+_wrapped = re.compile(r"^\s*<p\b[^>]*>(.*)</p>\s*$", re.S)
+_xml_parser = etree.XMLParser(resolve_entities=False, recover=False, no_network=True)
+
+
+_XML_NS = "http://www.w3.org/XML/1998/namespace"
+
+
+def _qualified(el, name):
+    """Clark 写法（{uri}local）还原成源文件中的带前缀名称，如 xml:lang、epub:type"""
+    if not name.startswith("{"):
+        # HTML 解析的结果：名称即原文（可能已带前缀）
+        return name
+    qname = etree.QName(name)
+    if qname.namespace == _XML_NS:
+        return f"xml:{qname.localname}"
+    for prefix, uri in el.nsmap.items():
+        if prefix and uri == qname.namespace:
+            return f"{prefix}:{qname.localname}"
+    return qname.localname
+
+
+def _open_tag(el):
+    """重建元素的开始标签：保留属性前缀，并带上该元素自己引入的命名空间声明"""
+    parent = el.getparent()
+    inherited = parent.nsmap if parent is not None else {}
+    decls = "".join(
+        f' xmlns{":" + prefix if prefix else ""}="{html.escape(uri)}"'
+        for prefix, uri in el.nsmap.items()
+        if inherited.get(prefix) != uri
+    )
+    attrs = "".join(f' {_qualified(el, k)}="{html.escape(v)}"' for k, v in el.attrib.items())
+    return f"<{_qualified(el, el.tag)}{decls}{attrs}>"
+
+
+def _close_tag(el):
+    return f"</{_qualified(el, el.tag)}>"
+
+
+def _parse(source):
+    try:
+        return etree.fromstring(source, _xml_parser)
+    except etree.XMLSyntaxError:
+        # 带前缀的属性（如 epub:type）缺少命名空间声明时退回 HTML 解析
+        return lxml_html.fragment_fromstring(source)
+
+
+class ParagraphSplitter:
+    """超长段落拆分：按句子或顶层行内标签切成若干段分别请求，译文再拼回一个段落
+
+    拆分阈值由实测的输出速度决定：单次请求的预计生成时间不超过 budget 秒
+    （默认为读取超时 HTTP_READ_TIMEOUT 的一半），并限制在 [min_tokens, max_tokens] 之间；
+    fixed > 0 时使用固定阈值
+    """
+
+    def __init__(self, fixed=0, budget=None, min_tokens=300, max_tokens=4000, default_tps=30, alpha=0.2):
+        self.fixed = fixed
+        self.budget = budget or float(os.getenv("HTTP_READ_TIMEOUT", "") or 120) / 2
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.tps = default_tps
+        self.alpha = alpha
+        self.samples = 0
+        self.split_count = 0
+
+    def observe(self, output_tokens, seconds):
+        """记录一次请求的输出 token 数与耗时；输出太短（延迟以首包为主）或耗时极短（命中翻译记忆）时不计入"""
+        if output_tokens < 32 or seconds < 0.05:
+            return
+        rate = output_tokens / seconds
+        self.tps = rate if self.samples == 0 else self.alpha * rate + (1 - self.alpha) * self.tps
+        self.samples += 1
+
+    def threshold(self):
+        if self.fixed > 0:
+            return self.fixed
+        return int(min(self.max_tokens, max(self.min_tokens, self.tps * self.budget)))
+
+    def oversized(self, source):
+        return estimate_tokens(source) > self.threshold()
+
+    def _sentences(self, text, limit):
+        """文本按句子切分（保留句间空白）；单句仍超长时按空白再切"""
+        for sentence in _sentence_end.split(text):
+            if estimate_tokens(sentence) <= limit:
+                yield sentence
+                continue
+            words, used = [], 0
+            for word in _word.findall(sentence):
+                tokens = estimate_tokens(word)
+                if words and used + tokens > limit:
+                    yield "".join(words)
+                    words, used = [], 0
+                words.append(word)
+                used += tokens
+            if words:
+                yield "".join(words)
+
+    def _atoms(self, el, limit):
+        """把元素内容切成不破坏标签的最小单元：文本按句子，子元素整体；超长的子元素递归拆开后各自补全标签"""
+        atoms = []
+
+        def text_atoms(text):
+            if text:
+                atoms.extend(html.escape(s, quote=False) for s in self._sentences(text, limit) if s)
+
+        text_atoms(el.text)
+        for child in el:
+            markup = etree.tostring(child, encoding="unicode", with_tail=False)
+            if isinstance(child.tag, str) and estimate_tokens(markup) > limit:
+                open_tag, close_tag = _open_tag(child), _close_tag(child)
+                atoms.extend(open_tag + "".join(part) + close_tag for part in self._pack(self._atoms(child, limit), limit))
+            else:
+                atoms.append(markup)
+            text_atoms(child.tail)
+        return atoms
+
+    @staticmethod
+    def _pack(atoms, limit):
+        pieces, piece, used = [], [], 0
+        for atom in atoms:
+            tokens = estimate_tokens(atom)
+            if piece and used + tokens > limit:
+                pieces.append(piece)
+                piece, used = [], 0
+            piece.append(atom)
+            used += tokens
+        if piece:
+            pieces.append(piece)
+        return pieces
+
+    def split(self, source):
+        """返回拆分后的段落列表（每段都是完整的 <p>）；无需拆分或无法拆分时返回 [source]"""
+        limit = self.threshold()
+        if estimate_tokens(source) <= limit:
+            return [source]
+        try:
+            root = _parse(source)
+        except (etree.ParserError, etree.XMLSyntaxError, ValueError) as e:
+            logger.warning(f"超长段落解析失败，不拆分: {e}")
+            return [source]
+
+        pieces = self._pack(self._atoms(root, limit), limit)
+        if len(pieces) < 2:
+            return [source]
+        open_tag, close_tag = _open_tag(root), _close_tag(root)
+        self.split_count += 1
+        return [open_tag + "".join(piece) + close_tag for piece in pieces]
+
+    @staticmethod
+    def stitch(source, translations):
+        """把各段译文拼回一个段落：去掉每段外层的 <p>，用原段落的标签包裹"""
+        if all(t.strip() == SKIPPED for t in translations):
+            return SKIPPED
+        root = _parse(source)
+        inner = []
+        for t in translations:
+            match = _wrapped.match(t)
+            inner.append(match.group(1) if match else t)
+        return _open_tag(root) + "".join(inner) + _close_tag(root)
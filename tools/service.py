@@ -0,0 +1,218 @@
+from tqdm.asyncio import tqdm
+from .batch import BatchRunner
+from .httpd import serve
+from .journal import ProgressJournal
+from .metrics import registry
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class Job:
+    def __init__(self, epub_path, priority=0, force=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.epub_path = epub_path
+        self.priority = priority
+        self.force = force
+        self.state = QUEUED
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cp = None
+        self.task = None
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "file": self.epub_path,
+            "priority": self.priority,
+            "state": self.state,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+def chapter_progress(cp):
+    """每章的完成情况：已完成的章节只标记 done，进行中的章节统计已有译文的段落数"""
+    chapters = []
+    for file_path in cp.get_next_file():
+        entry = {"file": os.path.relpath(file_path, cp.extract_dir), "done": bool(cp.data["files"].get(file_path))}
+        cp_data_path = cp.cp_data_path(file_path)
+        if not entry["done"] and os.path.exists(cp_data_path):
+            # 写入任务可能正在追加，只读不修复
+            progress = ProgressJournal.load(cp_data_path, repair=False)
+            entry["paragraphs"] = len(progress)
+            entry["translated"] = sum(1 for v in progress.values() if v)
+        chapters.append(entry)
+    return chapters
+
+
+class TranslationService:
+    """常驻翻译服务：翻译器、HTTP 连接池与限流器在任务之间保持复用，每本书仍走 Checkpoint / BatchRunner / EpubTool 流程
+
+    - 任务按优先级（数值大者优先）、提交顺序排队，最多 max_jobs 本同时翻译，共享同一个翻译器与限流状态
+    - 调整优先级只影响排队中的任务；取消运行中的任务时已写入的进度保留，重新提交即可续译
+    """
+
+    def __init__(self, make_checkpoint, translator, tasks, window=2, max_jobs=1, base_dir="."):
+        self.make_checkpoint = make_checkpoint
+        self.translator = translator
+        self.tasks = tasks
+        self.window = window
+        self.max_jobs = max(1, max_jobs)
+        self.base_dir = base_dir
+        self.jobs = {}
+        self.wakeup = asyncio.Event()
+        self.scheduler = None
+
+    def start(self):
+        self.scheduler = asyncio.create_task(self._schedule())
+
+    def submit(self, epub_path, priority=0, force=False):
+        if not os.path.isabs(epub_path):
+            epub_path = os.path.join(self.base_dir, epub_path)
+        if not os.path.exists(epub_path):
+            raise FileNotFoundError(epub_path)
+        for job in self.jobs.values():
+            if job.epub_path == epub_path and job.state in (QUEUED, RUNNING):
+                return job
+        job = Job(epub_path, priority, force)
+        self.jobs[job.id] = job
+        self._report()
+        self.wakeup.set()
+        tqdm.write(f"新任务 {job.id}: {epub_path} (优先级 {priority})")
+        return job
+
+    def cancel(self, job):
+        if job.state == QUEUED:
+            self._finish(job, CANCELLED)
+        elif job.state == RUNNING:
+            job.task.cancel()
+        return job
+
+    def reprioritize(self, job, priority):
+        job.priority = priority
+        self.wakeup.set()
+        return job
+
+    def _finish(self, job, state, error=None):
+        job.state = state
+        job.error = error
+        job.finished = time.time()
+        self._report()
+
+    def _report(self):
+        for state in (QUEUED, RUNNING):
+            registry.set("epub_service_jobs", sum(1 for j in self.jobs.values() if j.state == state), state=state)
+
+    def _next(self):
+        queued = [job for job in self.jobs.values() if job.state == QUEUED]
+        return min(queued, key=lambda job: (-job.priority, job.created), default=None)
+
+    async def _schedule(self):
+        while True:
+            running = sum(1 for job in self.jobs.values() if job.state == RUNNING)
+            job = self._next() if running < self.max_jobs else None
+            if job is None:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            job.state = RUNNING
+            job.started = time.time()
+            self._report()
+            job.task = asyncio.create_task(self._run(job))
+            # 尚未开始执行就被取消时 _run 内的处理不会运行
+            job.task.add_done_callback(lambda _, job=job: job.state == RUNNING and self._finish(job, CANCELLED))
+
+    async def _run(self, job):
+        try:
+            job.cp = await asyncio.to_thread(self.make_checkpoint, job.epub_path, job.force)
+            await BatchRunner([job.cp], self.translator, self.tasks, window=self.window).run()
+            await job.cp.journal.flush()
+            pending = [f for f, done in job.cp.data["files"].items() if not done]
+            if pending:
+                self._finish(job, FAILED, f"{len(pending)} 个章节未完成")
+            else:
+                self._finish(job, DONE)
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            logger.error(f"任务 {job.id} 失败: {e}")
+            self._finish(job, FAILED, str(e))
+        finally:
+            if job.cp is not None and job.cp._archive is not None:
+                job.cp.archive.close()
+            tqdm.write(f"任务 {job.id} 结束: {job.state}")
+            self.wakeup.set()
+
+    def detail(self, job):
+        data = job.summary()
+        if job.cp is not None:
+            data["chapters"] = chapter_progress(job.cp)
+        return data
+
+    async def handle(self, request):
+        parts = [p for p in request.path.split("/") if p]
+        method = request.method
+
+        if parts == ["health"]:
+            return 200, {}, {"status": "ok", "jobs": len(self.jobs)}
+        if parts == ["metrics"]:
+            return 200, {}, registry.render_prometheus()
+        if parts == ["jobs"] and method == "GET":
+            return 200, {}, [job.summary() for job in self.jobs.values()]
+        if parts == ["jobs"] and method == "POST":
+            body = request.json()
+            if not body.get("file"):
+                return 400, {}, {"error": "缺少 file"}
+            try:
+                job = self.submit(body["file"], int(body.get("priority", 0)), bool(body.get("force", False)))
+            except FileNotFoundError as e:
+                return 404, {}, {"error": f"文件不存在: {e}"}
+            return 201, {}, job.summary()
+
+        if len(parts) < 2 or parts[0] != "jobs":
+            return 404, {}, {"error": "not found"}
+        job = self.jobs.get(parts[1])
+        if job is None:
+            return 404, {}, {"error": f"任务不存在: {parts[1]}"}
+
+        match (method, parts[2:]):
+            case ("GET", []):
+                return 200, {}, await asyncio.to_thread(self.detail, job)
+            case ("POST", ["cancel"]) | ("DELETE", []):
+                return 200, {}, self.cancel(job).summary()
+            case ("POST", ["priority"]):
+                try:
+                    priority = int(request.json()["priority"])
+                except (KeyError, TypeError, ValueError):
+                    return 400, {}, {"error": "缺少或无效的 priority"}
+                return 200, {}, self.reprioritize(job, priority).summary()
+        return 405, {}, {"error": "method not allowed"}
+
+    async def serve(self, host="127.0.0.1", port=8765, unix_path=None):
+        self.start()
+        server = await serve(self.handle, host, port, unix_path)
+        where = unix_path or f"http://{host}:{server.sockets[0].getsockname()[1]}"
+        logger.info(f"翻译服务已启动: {where}")
+        tqdm.write(f"翻译服务已启动: {where}")
+        return server
+
+    async def close(self):
+        if self.scheduler is not None:
+            self.scheduler.cancel()
+        running = [job.task for job in self.jobs.values() if job.state == RUNNING and job.task]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
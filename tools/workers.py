@@ -0,0 +1,53 @@
+from tqdm.asyncio import tqdm
+
+import os
+import time
+
+
+def longest_first(weighted):
+    """[(预估 token, 单元)] 按 token 从大到小排列：长段落先发出，最后收尾的是短段落"""
+    return sorted(weighted, key=lambda entry: entry[0], reverse=True)
+
+
+class WorkerBoard:
+    """每个工作协程一行状态：当前处理的章节与段落、预估 token、已完成的单元数
+
+    取代按固定区间划分时每个任务一条的进度条；非终端输出时自动关闭
+    """
+
+    def __init__(self, workers, offset=1, interval=0.2):
+        self.interval = interval
+        self.done = [0] * workers
+        self.lines = [
+            tqdm(total=0, position=offset + i, bar_format="{desc}", leave=False, disable=None)
+            for i in range(workers)
+        ]
+        self._refreshed = [0.0] * workers
+        for i in range(workers):
+            self._show(i, "空闲", force=True)
+
+    def _show(self, worker, text, force=False):
+        line = self.lines[worker]
+        line.set_description_str(f"w{worker:02} [{self.done[worker]:>4}] {text}", refresh=False)
+        now = time.monotonic()
+        if force or now - self._refreshed[worker] >= self.interval:
+            self._refreshed[worker] = now
+            line.refresh()
+
+    def start(self, worker, file_path, unit, tokens):
+        where = f"#{unit[0]}" if len(unit) == 1 else f"#{unit[0]}-{unit[-1]}"
+        self._show(worker, f"{os.path.basename(file_path)[:16]} {where} ~{tokens} tok")
+
+    def finish(self, worker):
+        self.done[worker] += 1
+        self._show(worker, "空闲")
+
+    def close(self):
+        for line in self.lines:
+            line.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 import asyncio
+import re
 
 prompt = """你是一个专业的书籍翻译助手，你要完成给定文字->翻译文字的任务。
 任务(顺序决定优先级)：
@@ -8,6 +9,7 @@ prompt = """你是一个专业的书籍翻译助手，你要完成给定文字->
 3. 符合人类阅读习惯，包括合理的上下文连贯，语法，标点符号等。
 4. 这是一本计算机技术相关书籍，需要稍微润色一下(20%)，但是要注重于原意。
 5. class = programlisting 的段落不要进行翻译。
+6. 输入中形如 <!--§0--> 的注释是分段标记，必须原样保留在对应段落译文之前，不得增删或改动。
 
 注意事项（严格遵循）：
 1. 你的翻译将会最终输出到书籍中，不允许给出任何无关说明或者非原文的内容。
@@ -20,16 +22,67 @@ prompt = """你是一个专业的书籍翻译助手，你要完成给定文字->
 输入:<p class="programlisting">$ git pull</p>
 输出:<br/>
 
+输入：<!--§0--><p>Hello, <i>world</i>.</p>
+<!--§1--><p>Goodbye.</p>
+输出：<!--§0--><p>你好，<i>世界</i>。</p>
+<!--§1--><p>再见。</p>
+
 """
 
 
+_cjk = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 字 1 token，其余约 4 字符 1 token"""
+    cjk = len(_cjk.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+_marker = re.compile(r"<!--\s*§(\d+)\s*-->")
+
+
+class BatchMismatchError(Exception):
+    """批量译文中的分段标记与原文对不上"""
+
+
+def join_segments(texts: list[str]) -> str:
+    return "\n".join(f"<!--§{i}-->{text}" for i, text in enumerate(texts))
+
+
+def split_segments(text: str, count: int) -> list[str]:
+    """按分段标记拆回每段译文，标记缺失、重复或多余时抛出 BatchMismatchError"""
+    parts = _marker.split(text)
+    # parts: [标记前的内容, 序号, 译文, 序号, 译文, ...]
+    segments = {}
+    for i in range(1, len(parts) - 1, 2):
+        idx = int(parts[i])
+        if idx in segments or idx >= count:
+            raise BatchMismatchError(f"分段标记 {idx} 重复或越界")
+        segments[idx] = parts[i + 1].strip()
+
+    if len(segments) != count:
+        raise BatchMismatchError(f"分段标记数量不符：期望 {count}，实际 {len(segments)}")
+    return [segments[i] for i in range(count)]
+
+
 class AITranslator(ABC):
     @abstractmethod
     async def __call__(self, text: str) -> str:
         pass
 
+    async def translate_batch(self, texts: list[str]) -> list[str]:
+        """把多个段落用分段标记拼成一次请求，再按标记拆回"""
+        return split_segments(await self(join_segments(texts)), len(texts))
+
 
 class FooAITranslator(AITranslator):
+    # 占位输出，不能当作译文复用
+    placeholder = True
+
+    def __init__(self, prompt=None):
+        self.prompt = prompt
+
     async def __call__(self, text: str) -> str:
         await asyncio.sleep(0.2)
         return f"""<span style="color: red;">foo:</span> {text}"""
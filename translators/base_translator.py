@@ -1,15 +1,99 @@
 import logging
-from .base_api import AITranslator, FooAITranslator, prompt
-from .openai_style import OpenAITranslator
-from .openai_style_free import OpenAIFreeTranslator
+import importlib
+from .base_api import AITranslator, prompt
+from .profiles import has_profile
+from .memory import CachedTranslator, TranslationMemory
+from .pool import Backend, TranslatorPool
+from .hedge import HedgedTranslator
 logger = logging.getLogger(__name__)
 
-def get_translator(translator_type: str) -> AITranslator:
-    if translator_type == "foo":
-        return FooAITranslator()
-    elif translator_type == "openai":
-        return OpenAITranslator(prompt)
-    elif translator_type == "free":
-        return OpenAIFreeTranslator(prompt)
+# 第三方翻译服务通过该入口点组注册，如 pyproject.toml 中：
+# [project.entry-points."epub_translator.translators"]
+# mybackend = "my_pkg.translator:MyTranslator"
+# 入口点指向的对象以 factory(prompt) 的方式调用，返回 AITranslator
+ENTRY_POINT_GROUP = "epub_translator.translators"
+
+# 内置服务：名称 -> "模块:对象"，真正选用时才导入（openai SDK 较重）
+BUILTIN = {
+    "foo": ".base_api:FooAITranslator",
+    "openai": ".openai_style:OpenAITranslator",
+    "free": ".openai_style:OpenAIFreeTranslator",
+}
+PROFILE_TRANSLATOR = ".openai_style:OpenAICompatibleTranslator"
+
+_registry = dict(BUILTIN)
+_plugins = None
+
+
+def register(name: str, target):
+    """注册翻译服务，target 为 factory(prompt) 或 "模块:对象" 字符串"""
+    _registry[name] = target
+
+
+def _discover():
+    global _plugins
+    if _plugins is None:
+        from importlib.metadata import entry_points
+
+        _plugins = {ep.name: ep for ep in entry_points(group=ENTRY_POINT_GROUP)}
+    return _plugins
+
+
+def available() -> list[str]:
+    return sorted(set(_registry) | set(_discover()))
+
+
+def _load(target):
+    if not isinstance(target, str):
+        return target
+    module, _, attr = target.partition(":")
+    return getattr(importlib.import_module(module, __package__), attr)
+
+
+def _create(translator_type: str) -> AITranslator:
+    if translator_type in _registry:
+        return _load(_registry[translator_type])(prompt)
+    plugins = _discover()
+    if translator_type in plugins:
+        return plugins[translator_type].load()(prompt)
+    if has_profile(translator_type):
+        # .env 中的其他 OpenAI 兼容配置，如 DEEPSEEK_API_KEY / DEEPSEEK_API_URL / DEEPSEEK_MODEL
+        return _load(PROFILE_TRANSLATOR)(prompt, translator_type)
+    raise ValueError(f"Unsupported translator type: {translator_type}（可用: {', '.join(available())}）")
+
+
+def get_translator(
+    translator_type: str,
+    memory: TranslationMemory = None,
+    hedge_percentile: float = 0,
+    hedge_budget: float = 0.05,
+) -> AITranslator:
+    """translator_type 可以是单个服务，也可以是逗号分隔的多个服务（可带权重），如 "openai:2,free"
+
+    层次（由外到内）：翻译记忆 -> 对冲请求 -> 服务池 / 单个服务
+    """
+    specs = [spec.strip() for spec in translator_type.split(",") if spec.strip()]
+    if len(specs) == 1 and ":" not in specs[0]:
+        translator = _create(specs[0])
     else:
-        raise ValueError("Unsupported translator type")
\ No newline at end of file
+        backends = []
+        for spec in specs:
+            name, _, weight = spec.partition(":")
+            backends.append(Backend(name, _create(name), float(weight or 1)))
+        translator = TranslatorPool(backends)
+
+    if hedge_percentile > 0:
+        translator = HedgedTranslator(translator, hedge_percentile, hedge_budget)
+
+    if memory is not None:
+        return CachedTranslator(translator, memory)
+    return translator
+
+
+def find_layer(translator: AITranslator, cls):
+    """沿 inner 由外向内查找 cls 类型的一层（如 HedgedTranslator），没有时返回 None"""
+    while translator is not None:
+        if isinstance(translator, cls):
+            return translator
+        translator = getattr(translator, "inner", None)
+    return None
\ No newline at end of file
@@ -0,0 +1,236 @@
+from .base_api import AITranslator, BatchMismatchError, split_segments
+from .http_pool import get_http_client
+from .profiles import load_env, profile_prefix
+
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHAT_URL = "/v1/chat/completions"
+# 批处理任务的终态
+FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+class OpenAIBatchEndpoint:
+    """OpenAI Batch API：上传 JSONL -> 创建任务 -> 轮询 -> 下载结果，配置同聊天接口（.env 中的 {prefix}API_KEY / API_URL）"""
+
+    def __init__(self, profile="openai"):
+        from openai import AsyncOpenAI
+
+        load_env()
+        prefix = profile_prefix(profile)
+        self.client = AsyncOpenAI(
+            api_key=os.getenv(f"{prefix}API_KEY"),
+            base_url=os.getenv(f"{prefix}API_URL"),
+            http_client=get_http_client(),
+        )
+
+    async def upload(self, path):
+        with open(path, "rb") as f:
+            return (await self.client.files.create(file=f, purpose="batch")).id
+
+    async def create(self, file_id, metadata=None):
+        batch = await self.client.batches.create(
+            input_file_id=file_id, endpoint=CHAT_URL, completion_window="24h", metadata=metadata
+        )
+        return batch.id
+
+    async def retrieve(self, batch_id):
+        batch = await self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+            "completed": counts.completed if counts else 0,
+            "failed": counts.failed if counts else 0,
+        }
+
+    async def download(self, file_id, dest):
+        content = await self.client.files.content(file_id)
+        with open(dest, "wb") as f:
+            f.write(content.read())
+
+    async def cancel(self, batch_id):
+        await self.client.batches.cancel(batch_id)
+
+
+class LocalBatchEndpoint:
+    """基于本地目录的批处理服务替身，接口与 OpenAIBatchEndpoint 相同，用于离线演练与调试
+
+    任务提交 delay 秒后的第一次查询时处理整个输入文件，respond(body) 生成译文（默认与 foo 相同）；
+    fail_every > 0 时每 fail_every 个请求返回一个错误，用于演练部分失败后的续跑
+    """
+
+    # 输出是演练用的占位内容
+    placeholder = True
+
+    def __init__(self, root, delay=0.0, respond=None, fail_every=0):
+        self.root = root
+        self.delay = delay
+        self.respond = respond or self.echo
+        self.fail_every = fail_every
+        os.makedirs(os.path.join(root, "files"), exist_ok=True)
+        os.makedirs(os.path.join(root, "batches"), exist_ok=True)
+
+    @staticmethod
+    def echo(body):
+        text = body["messages"][-1]["content"]
+        return f"""<span style="color: red;">foo:</span> {text}"""
+
+    def _file(self, file_id):
+        return os.path.join(self.root, "files", f"{file_id}.jsonl")
+
+    def _batch(self, batch_id):
+        return os.path.join(self.root, "batches", f"{batch_id}.json")
+
+    def _save(self, batch):
+        with open(self._batch(batch["id"]), "w", encoding="utf-8") as f:
+            json.dump(batch, f)
+
+    async def upload(self, path):
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        shutil.copyfile(path, self._file(file_id))
+        return file_id
+
+    async def create(self, file_id, metadata=None):
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:12]}",
+            "input_file_id": file_id,
+            "status": "in_progress",
+            "created": time.time(),
+            "metadata": metadata,
+            "output_file_id": None,
+            "error_file_id": None,
+            "completed": 0,
+            "failed": 0,
+        }
+        self._save(batch)
+        return batch["id"]
+
+    def _process(self, batch):
+        outputs, errors = [], []
+        with open(self._file(batch["input_file_id"]), encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                request = json.loads(line)
+                custom_id = request["custom_id"]
+                if self.fail_every and n % self.fail_every == 0:
+                    errors.append({"custom_id": custom_id, "response": None, "error": {"message": "simulated failure"}})
+                    continue
+                content = self.respond(request["body"])
+                body = {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+                outputs.append({"custom_id": custom_id, "response": {"status_code": 200, "body": body}, "error": None})
+
+        for key, lines in (("output_file_id", outputs), ("error_file_id", errors)):
+            if lines:
+                file_id = f"file-{uuid.uuid4().hex[:12]}"
+                with open(self._file(file_id), "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+                batch[key] = file_id
+        batch.update(status="completed", completed=len(outputs), failed=len(errors))
+
+    async def retrieve(self, batch_id):
+        with open(self._batch(batch_id), encoding="utf-8") as f:
+            batch = json.load(f)
+        if batch["status"] == "in_progress" and time.time() - batch["created"] >= self.delay:
+            await asyncio.to_thread(self._process, batch)
+            self._save(batch)
+        return batch
+
+    async def download(self, file_id, dest):
+        shutil.copyfile(self._file(file_id), dest)
+
+    async def cancel(self, batch_id):
+        batch = await self.retrieve(batch_id)
+        if batch["status"] not in FINAL_STATES:
+            batch["status"] = "cancelled"
+            self._save(batch)
+
+
+class BatchAPITranslator(AITranslator):
+    """通过批处理接口翻译：请求写成 OpenAI batch 格式的 JSONL 一次性提交，结果在完成窗口内返回
+
+    整本书的批量提交由 tools.bulk.BulkRunner 驱动；直接调用 __call__ 时提交单条请求的任务并等待结果
+    """
+
+    def __init__(self, prompt, profile="openai", endpoint=None, poll_interval=60):
+        load_env()
+        prefix = profile_prefix(profile)
+        self.profile = profile
+        self.prompt = prompt
+        self.model = os.getenv(f"{prefix}MODEL")
+        self.temperature = float(os.getenv(f"{prefix}TEMPERATURE", "") or 0.7)
+        self.endpoint = endpoint or OpenAIBatchEndpoint(profile)
+        self.poll_interval = poll_interval
+
+    @property
+    def placeholder(self):
+        return getattr(self.endpoint, "placeholder", False)
+
+    def request_line(self, custom_id, text):
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": CHAT_URL,
+            "body": {
+                "model": self.model,
+                "messages": [
+                    {"role": "system", "content": self.prompt},
+                    {"role": "user", "content": text},
+                ],
+                "temperature": self.temperature,
+            },
+        }
+
+    async def submit(self, path, metadata=None):
+        file_id = await self.endpoint.upload(path)
+        return await self.endpoint.create(file_id, metadata)
+
+    async def wait(self, batch_id):
+        while (batch := await self.endpoint.retrieve(batch_id))["status"] not in FINAL_STATES:
+            await asyncio.sleep(self.poll_interval)
+        return batch
+
+    async def results(self, batch, dest):
+        """下载结果并返回 {custom_id: 译文}；失败的请求不在其中"""
+        found = {}
+        if not batch.get("output_file_id"):
+            return found
+        await self.endpoint.download(batch["output_file_id"], dest)
+        with open(dest, encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code") != 200:
+                    continue
+                found[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        return found
+
+    @staticmethod
+    def split(content, count):
+        """多段合并的请求按分段标记拆回；对不上时返回 None，由下一轮重新提交"""
+        if count == 1:
+            return [content]
+        try:
+            return split_segments(content, count)
+        except BatchMismatchError:
+            return None
+
+    async def __call__(self, text: str) -> str:
+        with tempfile.TemporaryDirectory(prefix="epub-batch-") as tmp:
+            path = os.path.join(tmp, "single.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(self.request_line("0", text), ensure_ascii=False) + "\n")
+            batch_id = await self.submit(path)
+            batch = await self.wait(batch_id)
+            found = await self.results(batch, f"{path}.out")
+        if "0" not in found:
+            raise RuntimeError(f"批处理任务 {batch_id} 未返回结果 ({batch['status']})")
+        return found["0"]
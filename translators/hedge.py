@@ -0,0 +1,118 @@
+from collections import deque
+from .base_api import AITranslator
+from tools.metrics import registry
+
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyWindow:
+    """最近 size 次成功请求的延迟，用于估算分位数"""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgedTranslator(AITranslator):
+    """对冲请求：请求耗时超过历史延迟的 percentile 分位时，再发一份相同的请求，
+    先返回有效结果的一方胜出，另一方被取消
+
+    - 单段与批量请求分别统计延迟
+    - 样本少于 min_samples 时不对冲；对冲阈值不低于 min_delay 秒
+    - 对冲请求数不超过主请求数的 budget 比例（外加 burst 个启动额度）
+    - 内层是 TranslatorPool 时，对冲请求按池的权重重新选择服务，通常会落到另一个服务上
+    """
+
+    def __init__(self, inner, percentile=0.95, budget=0.05, burst=2, min_samples=20, min_delay=1.0):
+        self.inner = inner
+        self.model = getattr(inner, "model", None) or type(inner).__name__
+        self.prompt = getattr(inner, "prompt", "")
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.windows = {"single": LatencyWindow(), "batch": LatencyWindow()}
+        self.requests = 0
+        self.hedged = 0
+        self.wins = 0
+
+    def threshold(self, kind):
+        window = self.windows[kind]
+        if len(window.samples) < self.min_samples:
+            return None
+        return max(self.min_delay, window.percentile(self.percentile))
+
+    def _allow(self):
+        return self.hedged < self.budget * self.requests + self.burst
+
+    async def _run(self, kind, call):
+        self.requests += 1
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(call())
+        tasks = {primary}
+        try:
+            delay = self.threshold(kind)
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and not self._allow():
+                registry.inc("epub_hedge_total", outcome="budget_exhausted")
+                await asyncio.wait(tasks)
+            elif not done:
+                self.hedged += 1
+                registry.inc("epub_hedge_total", outcome="sent")
+                backup_start = time.perf_counter()
+                backup = asyncio.ensure_future(call())
+                tasks.add(backup)
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+
+                    if task is primary:
+                        elapsed = time.perf_counter() - start
+                        if len(done) == 1 and tasks:
+                            registry.inc("epub_hedge_total", outcome="primary_won")
+                    else:
+                        elapsed = time.perf_counter() - backup_start
+                        self.wins += 1
+                        registry.inc("epub_hedge_total", outcome="backup_won")
+                    self.windows[kind].add(elapsed)
+                    return task.result()
+
+            raise error
+        finally:
+            # 输家（或外层被取消时的全部请求）一律取消
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def __call__(self, text: str) -> str:
+        return await self._run("single", lambda: self.inner(text))
+
+    async def translate_batch(self, texts: list[str]) -> list[str]:
+        return await self._run("batch", lambda: self.inner.translate_batch(texts))
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "backup_won": self.wins,
+            "hedge_rate": round(self.hedged / self.requests, 4) if self.requests else 0,
+        }
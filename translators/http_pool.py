@@ -0,0 +1,55 @@
+from importlib.util import find_spec
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, "") or default)
+
+
+def request_timeout():
+    """单次请求的超时：连接与读取分开设置，读取需覆盖长段落的生成时间"""
+    import httpx
+
+    return httpx.Timeout(
+        connect=_env_float("HTTP_CONNECT_TIMEOUT", 10),
+        read=_env_float("HTTP_READ_TIMEOUT", 120),
+        write=_env_float("HTTP_WRITE_TIMEOUT", 30),
+        pool=_env_float("HTTP_POOL_TIMEOUT", 60),
+    )
+
+
+def get_http_client():
+    """所有 OpenAI 兼容服务共享的连接池，配置读取 .env：
+    HTTP_MAX_CONNECTIONS / HTTP_MAX_KEEPALIVE / HTTP_KEEPALIVE_EXPIRY / HTTP2（安装了 h2 时默认开启）
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+        from openai import DefaultAsyncHttpxClient
+
+        max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "") or 128)
+        http2 = os.getenv("HTTP2", "1") not in ("0", "false", "False") and find_spec("h2") is not None
+        _client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "") or max_connections),
+                keepalive_expiry=_env_float("HTTP_KEEPALIVE_EXPIRY", 90),
+            ),
+            timeout=request_timeout(),
+            http2=http2,
+        )
+        logger.info(f"HTTP 连接池: max_connections={max_connections}, http2={http2}")
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
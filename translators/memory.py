@@ -0,0 +1,241 @@
+from .base_api import AITranslator
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_spaces = re.compile(r"\s+")
+
+
+class TranslationMemory:
+    """基于 SQLite 的翻译记忆：按（规范化原文, 模型, 提示词哈希）精确匹配，按 LRU 淘汰"""
+
+    def __init__(self, path, max_entries=200_000, max_age_days=180, evict_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS tm (
+                key TEXT PRIMARY KEY,
+                translation TEXT NOT NULL,
+                model TEXT,
+                created REAL,
+                last_used REAL
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tm_last_used ON tm(last_used)")
+        self.conn.commit()
+        self.evict()
+
+    @staticmethod
+    def normalize(text):
+        return _spaces.sub(" ", text).strip()
+
+    @staticmethod
+    def make_key(text, model, prompt):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+        source = TranslationMemory.normalize(text)
+        return hashlib.sha256(f"{model}\0{prompt_hash}\0{source}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """批量查询，命中的条目在同一个事务里更新 last_used"""
+        results = []
+        with self._lock:
+            for key in keys:
+                row = self.conn.execute(
+                    "SELECT translation FROM tm WHERE key = ?", (key,)
+                ).fetchone()
+                results.append(row[0] if row is not None else None)
+            hit = [(time.time(), key) for key, r in zip(keys, results) if r is not None]
+            if hit:
+                self.conn.executemany("UPDATE tm SET last_used = ? WHERE key = ?", hit)
+                self.conn.commit()
+            self.hits += len(hit)
+            self.misses += len(keys) - len(hit)
+        return results
+
+    def put(self, key, translation, model=None):
+        self.put_many([(key, translation)], model)
+
+    def put_many(self, items, model=None):
+        """批量写入 [(key, 译文)]，一次提交"""
+        now = time.time()
+        rows = [(key, t, model, now, now) for key, t in items if t and t.strip()]
+        if not rows:
+            return
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO tm (key, translation, model, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.commit()
+            before = self._puts
+            self._puts += len(rows)
+        if self._puts // self.evict_every > before // self.evict_every:
+            self.evict()
+
+    def evict(self):
+        """删除超过 max_age 未使用的条目，并把条目数压到 max_entries 以内（最久未用的先删）"""
+        with self._lock:
+            removed = self.conn.execute(
+                "DELETE FROM tm WHERE last_used < ?", (time.time() - self.max_age,)
+            ).rowcount
+            count = self.conn.execute("SELECT COUNT(*) FROM tm").fetchone()[0]
+            if count > self.max_entries:
+                removed += self.conn.execute(
+                    "DELETE FROM tm WHERE key IN (SELECT key FROM tm ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                ).rowcount
+            self.conn.commit()
+        if removed:
+            logger.info(f"翻译记忆淘汰 {removed} 条")
+
+    def stats(self):
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM tm").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def model_key(translator):
+    """翻译记忆使用的模型标识：跳过对冲等包装层，取真正发请求的服务；服务池为各服务标识的组合"""
+    while hasattr(translator, "inner"):
+        translator = translator.inner
+    backends = getattr(translator, "backends", None)
+    if backends is not None:
+        return ",".join(sorted({model_key(b.translator) for b in backends}))
+    model = getattr(translator, "model", None)
+    if model:
+        return model
+    profile = getattr(translator, "profile", None)
+    return f"{type(translator).__name__}:{profile}" if profile else type(translator).__name__
+
+
+def is_placeholder(translator):
+    """foo 等占位服务（包括本地批处理替身）的输出不是真正的译文；服务池中有一个占位服务即视为占位"""
+    while hasattr(translator, "inner"):
+        translator = translator.inner
+    backends = getattr(translator, "backends", None)
+    if backends is not None:
+        return any(is_placeholder(b.translator) for b in backends)
+    return bool(getattr(translator, "placeholder", False))
+
+
+class CachedTranslator(AITranslator):
+    """给任意 AITranslator 套上翻译记忆；并发请求相同原文时只发一次请求
+
+    SQLite 读写在线程中执行，不阻塞事件循环
+    """
+
+    def __init__(self, inner: AITranslator, memory: TranslationMemory):
+        self.inner = inner
+        self.memory = memory
+        self.model = model_key(inner)
+        self.prompt = getattr(inner, "prompt", "")
+        self.inflight = {}
+
+    async def _fetch(self, key, text):
+        try:
+            translated = await self.inner(text)
+            await asyncio.to_thread(self.memory.put, key, translated, self.model)
+            return translated
+        finally:
+            self.inflight.pop(key, None)
+
+    async def __call__(self, text: str) -> str:
+        key = self.memory.make_key(text, self.model, self.prompt)
+        cached = await asyncio.to_thread(self.memory.get, key)
+        if cached is not None:
+            return cached
+
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, text))
+            self.inflight[key] = task
+        else:
+            self.memory.shared += 1
+        # shield：某个等待方被取消时，其余等待方仍能拿到结果
+        result = await asyncio.shield(task)
+        if result is None:
+            # 共享的批量请求失败，自行请求
+            return await self(text)
+        return result
+
+    async def translate_batch(self, texts: list[str]) -> list[str]:
+        keys = [self.memory.make_key(text, self.model, self.prompt) for text in texts]
+        results = await asyncio.to_thread(self.memory.get_many, keys)
+
+        waiting = {}
+        missing = []
+        pending = {}
+        for i, key in enumerate(keys):
+            if results[i] is not None:
+                continue
+            if key in self.inflight:
+                self.memory.shared += 1
+                waiting[i] = self.inflight[key]
+            elif key in pending:
+                self.memory.shared += 1
+            else:
+                missing.append(i)
+                # 登记为进行中，同一时间窗口内其他请求遇到相同原文时等待这里的结果
+                pending[key] = asyncio.get_running_loop().create_future()
+                self.inflight[key] = pending[key]
+
+        try:
+            if len(missing) == 1:
+                translated = [await self.inner(texts[missing[0]])]
+            elif missing:
+                translated = await self.inner.translate_batch([texts[i] for i in missing])
+            else:
+                translated = []
+            for i, text in zip(missing, translated):
+                results[i] = text
+                pending[keys[i]].set_result(text)
+            await asyncio.to_thread(self.memory.put_many, [(keys[i], results[i]) for i in missing], self.model)
+        finally:
+            for key, fut in pending.items():
+                self.inflight.pop(key, None)
+                if not fut.done():
+                    # 批量请求失败（如分段标记对不上）或被取消：等待方改为各自请求
+                    fut.set_result(None)
+
+        for i, task in waiting.items():
+            results[i] = await asyncio.shield(task)
+            if results[i] is None:
+                results[i] = await self(texts[i])
+
+        # 同一批内重复的段落直接复用
+        by_key = {keys[i]: results[i] for i in missing}
+        return [r if r is not None else by_key[keys[i]] for i, r in enumerate(results)]
@@ -1,48 +1,77 @@
-from .base_api import AITranslator
-from openai import AsyncOpenAI
-from random import randint
+from .base_api import AITranslator, estimate_tokens
+from .http_pool import get_http_client, request_timeout
+from .profiles import load_env, profile_prefix
+from .rate_governor import get_governor, governed_call, record_usage
+from openai import AsyncOpenAI, APIConnectionError
 
-import logging, asyncio, os, dotenv
+import logging, os
 
 logger = logging.getLogger(__name__)
 
-dotenv.load_dotenv(override=True)
 
-API_KEY = os.getenv("API_KEY")
-API_URL = os.getenv("API_URL")
-MODEL = os.getenv("MODEL")
+class OpenAICompatibleTranslator(AITranslator):
+    """任意 OpenAI 兼容服务，按配置名读取 .env：
+    {prefix}API_KEY / {prefix}API_URL / {prefix}MODEL / {prefix}TEMPERATURE
+    所有配置共享同一个 HTTP 连接池，限流器按配置名区分
+    """
 
-
-class OpenAITranslator(AITranslator):
-
-    def __init__(self, prompt):
+    def __init__(self, prompt, profile="openai"):
+        load_env()
+        prefix = profile_prefix(profile)
+        self.profile = profile
         self.prompt = prompt
+        self.model = os.getenv(f"{prefix}MODEL")
+        self.temperature = float(os.getenv(f"{prefix}TEMPERATURE", "") or 0.7)
         self.client = AsyncOpenAI(
-            api_key=API_KEY,
-            base_url=API_URL,
-            max_retries=5,
+            api_key=os.getenv(f"{prefix}API_KEY"),
+            base_url=os.getenv(f"{prefix}API_URL"),
+            max_retries=0,
+            http_client=get_http_client(),
         )
+        self.timeout = request_timeout()
+        self.governor = get_governor(profile, prefix)
+        self.prompt_tokens = estimate_tokens(prompt)
 
     async def __call__(self, text: str) -> str:
-        """调用 OpenAI API 翻译文本（带冷却时间）"""
+        """调用 OpenAI 兼容 API 翻译文本（由限流器控制发送速率）"""
 
-        try:
-            response = await self.client.chat.completions.create(
-                model=MODEL,
+        async def request():
+            raw = await self.client.chat.completions.with_raw_response.create(
+                model=self.model,
                 messages=[
                     {"role": "system", "content": self.prompt},
                     {"role": "user", "content": text},
                 ],
-                temperature=0.7,
-                timeout=30,
+                temperature=self.temperature,
+                timeout=self.timeout,
                 logprobs=False,
             )
-            translated_text = response.choices[0].message.content
+            response = raw.parse()
+            usage = record_usage(self.governor, response.usage)
+            return response.choices[0].message.content, raw.headers, usage
+
+        # 预估用量：系统提示 + 原文 + 与原文等长的译文
+        cost = self.prompt_tokens + 2 * estimate_tokens(text)
+        try:
+            translated_text = await governed_call(
+                self.governor,
+                cost,
+                request,
+                max_retries=5,
+                transient_errors=(APIConnectionError,),
+            )
         except Exception as e:
-            logger.error(f"api 请求失败: {e}")
+            logger.error(f"[{self.profile}] api 请求失败: {e}")
             raise e
 
-        sleep_time = randint(5, 6)
-        await asyncio.sleep(sleep_time)
-
         return f"""{translated_text}"""
+
+
+class OpenAITranslator(OpenAICompatibleTranslator):
+    def __init__(self, prompt):
+        super().__init__(prompt, "openai")
+
+
+class OpenAIFreeTranslator(OpenAICompatibleTranslator):
+    def __init__(self, prompt):
+        super().__init__(prompt, "free")
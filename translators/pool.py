@@ -0,0 +1,138 @@
+from .base_api import AITranslator, BatchMismatchError
+from tools.metrics import registry
+
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Backend:
+    """池中的一个翻译服务：记录延迟/错误率的滑动平均，并带熔断器
+
+    - 连续失败 failure_threshold 次后熔断 cooldown 秒，期间不参与调度
+    - 冷却结束后放行一个探测请求（半开），成功则恢复，失败则冷却时间翻倍
+    """
+
+    def __init__(self, name, translator, weight=1.0, failure_threshold=5, cooldown=30, max_cooldown=300):
+        self.name = name
+        self.translator = translator
+        self.weight = weight
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.in_flight = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def available(self, now):
+        if self.open_until == 0:
+            return True
+        # 半开：冷却结束后只放行一个探测请求
+        return now >= self.open_until and not self.probing
+
+    def score(self, now):
+        """调度权重：越快、越稳、剩余配额越多的服务分到越多段落"""
+        latency = self.latency if self.latency is not None else 1.0
+        score = self.weight * max(0.05, 1 - self.error_rate) / max(latency, 0.01)
+
+        governor = getattr(self.translator, "governor", None)
+        if governor is None:
+            return score / (1 + self.in_flight)
+        if governor.paused_until > time.monotonic():
+            return score * 0.05
+        headroom = max(0, int(governor.limit) - governor.in_flight)
+        return score * (1 + headroom) / (1 + governor.waiting)
+
+    def record(self, ok, elapsed=None, alpha=0.2):
+        self.error_rate = (1 - alpha) * self.error_rate + alpha * (0 if ok else 1)
+        if ok:
+            self.latency = elapsed if self.latency is None else (1 - alpha) * self.latency + alpha * elapsed
+            if self.open_until:
+                logger.info(f"[{self.name}] 探测成功，恢复调度")
+            self.failures = 0
+            self.open_until = 0.0
+            self.cooldown = self.base_cooldown
+        else:
+            self.failures += 1
+            if self.probing:
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self.open_until = time.monotonic() + self.cooldown
+                logger.warning(f"[{self.name}] 探测失败，熔断 {self.cooldown}s")
+            elif not self.open_until and self.failures >= self.failure_threshold:
+                # 熔断前已发出的请求陆续失败时不重复计时
+                self.open_until = time.monotonic() + self.cooldown
+                logger.warning(f"[{self.name}] 连续失败 {self.failures} 次，熔断 {self.cooldown}s")
+        self.probing = False
+        registry.set("epub_pool_breaker_open", 1 if self.open_until else 0, backend=self.name)
+
+
+class TranslatorPool(AITranslator):
+    """多个翻译服务组成的池：按实时延迟、错误率与剩余配额加权分配请求，
+    某个服务失败时换下一个服务重试同一段落，所有服务都失败才抛出异常
+    """
+
+    def __init__(self, backends):
+        self.backends = backends
+        models = sorted({getattr(b.translator, "model", None) or type(b.translator).__name__ for b in backends})
+        self.model = ",".join(models)
+        self.prompt = getattr(backends[0].translator, "prompt", "")
+
+    def pick(self, exclude):
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b not in exclude and b.available(now)]
+        if not candidates:
+            # 全部熔断时选最早恢复的那个作为探测，不让整本书停下来
+            rest = [b for b in self.backends if b not in exclude]
+            if not rest:
+                return None
+            return min(rest, key=lambda b: b.open_until)
+
+        weights = [b.score(now) for b in candidates]
+        return random.choices(candidates, weights)[0]
+
+    async def _call(self, method, payload):
+        tried = set()
+        last_error = None
+        while (backend := self.pick(tried)) is not None:
+            tried.add(backend)
+            if backend.open_until:
+                backend.probing = True
+
+            backend.in_flight += 1
+            start = time.perf_counter()
+            try:
+                result = await getattr(backend.translator, method)(payload)
+            except (BatchMismatchError, asyncio.CancelledError):
+                # 拆分失败与服务健康无关，交给上层二分重试
+                backend.probing = False
+                raise
+            except Exception as e:
+                backend.record(False)
+                last_error = e
+                if len(tried) < len(self.backends):
+                    logger.info(f"[{backend.name}] 请求失败({e})，换用其他服务重试")
+                    registry.inc("epub_pool_failovers_total", backend=backend.name)
+                continue
+            finally:
+                backend.in_flight -= 1
+
+            # 批量请求按段落数折算，单段与批量的延迟才可比较
+            size = len(payload) if isinstance(payload, list) else 1
+            backend.record(True, (time.perf_counter() - start) / size)
+            registry.inc("epub_pool_requests_total", backend=backend.name)
+            return result
+
+        raise last_error
+
+    async def __call__(self, text: str) -> str:
+        return await self._call("__call__", text)
+
+    async def translate_batch(self, texts: list[str]) -> list[str]:
+        return await self._call("translate_batch", texts)
@@ -0,0 +1,31 @@
+import os
+
+_env_loaded = False
+
+
+def load_env():
+    """首次需要服务配置时才读取 .env"""
+    global _env_loaded
+    if not _env_loaded:
+        import dotenv
+
+        dotenv.load_dotenv(override=True)
+        _env_loaded = True
+
+# 内置配置名与 .env 前缀的对应关系，其余名称使用 "<NAME>_" 前缀
+PROFILE_PREFIXES = {"openai": "", "free": "FREE_"}
+
+
+def profile_prefix(profile):
+    return PROFILE_PREFIXES.get(profile, f"{profile.upper()}_")
+
+
+def has_profile(profile):
+    load_env()
+    return bool(os.getenv(f"{profile_prefix(profile)}API_KEY"))
+
+
+def profile_env(profile, name, default=None):
+    """读取某个配置的 .env 项，如 profile_env("free", "MODEL") -> FREE_MODEL"""
+    load_env()
+    return os.getenv(f"{profile_prefix(profile)}{name}") or default
@@ -0,0 +1,285 @@
+from tools.metrics import registry
+
+import asyncio
+import contextvars
+import logging
+import os
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """按分钟配额匀速补充的令牌桶，rate_per_min 为 0 表示不限制"""
+
+    def __init__(self, rate_per_min):
+        self.rate = rate_per_min / 60
+        self.capacity = float(rate_per_min)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """还需等待多少秒才能取出 amount 个令牌"""
+        if self.rate <= 0:
+            return 0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        if self.rate <= 0:
+            return
+        self._refill()
+        # 允许透支（负数），实际用量超过预估时由后续请求偿还
+        self.tokens -= amount
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+
+def parse_duration(value):
+    """解析 Retry-After / x-ratelimit-reset-* 的取值，如 "2"、"1.5s"、"6m0s"、"20ms"、HTTP 日期"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if parts:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(n) * scale[unit] for n, unit in parts)
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateGovernor:
+    """同一服务商共享的限流器：RPM/TPM 令牌桶 + AIMD 并发控制
+
+    - 成功：并发上限每轮加性增长（+1/limit）
+    - 429/5xx：并发上限减半，并按 Retry-After 暂停发送
+    - x-ratelimit-remaining-* 归零时，按 x-ratelimit-reset-* 暂停
+    """
+
+    def __init__(self, name, rpm=0, tpm=0, max_concurrency=16, min_concurrency=1):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(min(4, self.max_concurrency))
+        self.in_flight = 0
+        self.waiting = 0
+        self.paused_until = 0.0
+        self.cond = None
+
+    def _condition(self):
+        if self.cond is None:
+            self.cond = asyncio.Condition()
+        return self.cond
+
+    def _pause(self, seconds):
+        if seconds and seconds > 0:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, cost=0):
+        """占用一个并发名额，并从请求/令牌桶中扣除本次预估用量"""
+        cond = self._condition()
+        self.waiting += 1
+        self._report()
+        try:
+            async with cond:
+                while True:
+                    if self.in_flight < int(self.limit):
+                        delay = max(
+                            self.paused_until - time.monotonic(),
+                            self.requests.wait_time(1),
+                            self.tokens.wait_time(cost),
+                        )
+                        if delay <= 0:
+                            break
+                    else:
+                        delay = None
+
+                    try:
+                        await asyncio.wait_for(cond.wait(), delay)
+                    except TimeoutError:
+                        pass
+
+                self.in_flight += 1
+                self.requests.consume(1)
+                self.tokens.consume(cost)
+        finally:
+            # 等待中被取消（如对冲请求的落败方）也要减掉
+            self.waiting -= 1
+            self._report()
+
+    async def release(self, ok=True, throttled=False, headers=None, cost=0, used_tokens=None):
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+
+            if used_tokens is not None:
+                self.tokens.consume(used_tokens - cost)
+
+            if throttled:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                retry_after = self._retry_after(headers)
+                self.requests.drain()
+                self._pause(retry_after if retry_after is not None else 1)
+                logger.warning(
+                    f"[{self.name}] 触发限流，并发上限降至 {int(self.limit)}，暂停 {retry_after or 1:.1f}s"
+                )
+            elif ok:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+            self._apply_headers(headers)
+            self._report()
+            cond.notify_all()
+
+    def _report(self):
+        registry.set("epub_in_flight", self.in_flight, translator=self.name)
+        registry.set("epub_queue_depth", self.waiting, translator=self.name)
+        registry.set("epub_concurrency_limit", int(self.limit), translator=self.name)
+
+    @staticmethod
+    def _header(headers, name):
+        if not headers:
+            return None
+        return headers.get(name)
+
+    def _retry_after(self, headers):
+        retry_ms = self._header(headers, "retry-after-ms")
+        if retry_ms is not None:
+            try:
+                return float(retry_ms) / 1000
+            except ValueError:
+                pass
+        return parse_duration(self._header(headers, "retry-after"))
+
+    def _apply_headers(self, headers):
+        for kind in ("requests", "tokens"):
+            remaining = self._header(headers, f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                continue
+            if remaining <= 0:
+                self._pause(parse_duration(self._header(headers, f"x-ratelimit-reset-{kind}")))
+
+
+_governors = {}
+
+
+def get_governor(name, env_prefix=""):
+    """按服务商名称获取共享的限流器，配置读取 .env：
+    {prefix}API_RPM / {prefix}API_TPM / {prefix}API_CONCURRENCY
+    """
+    if name not in _governors:
+        _governors[name] = RateGovernor(
+            name,
+            rpm=int(os.getenv(f"{env_prefix}API_RPM", "0") or 0),
+            tpm=int(os.getenv(f"{env_prefix}API_TPM", "0") or 0),
+            max_concurrency=int(os.getenv(f"{env_prefix}API_CONCURRENCY", "16") or 16),
+        )
+    return _governors[name]
+
+
+def record_usage(governor, usage):
+    """记录响应中的 prompt/completion token 数，返回总用量（无 usage 时为 None）"""
+    if usage is None:
+        return None
+    registry.inc("epub_tokens_total", usage.prompt_tokens or 0, translator=governor.name, direction="in")
+    registry.inc("epub_tokens_total", usage.completion_tokens or 0, translator=governor.name, direction="out")
+    return usage.total_tokens
+
+
+_request_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+class RequestTimer:
+    """记录作用域内第一个成功请求的耗时（不含在限流器中排队与重试退避的时间）；没有发出请求时 seconds 为 None"""
+
+    def __init__(self):
+        self.seconds = None
+        self._token = None
+
+    def __enter__(self):
+        self._token = _request_timer.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _request_timer.reset(self._token)
+
+
+def _is_retryable(e, transient_errors):
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(e, transient_errors)
+
+
+async def governed_call(governor, cost, request, max_retries=5, transient_errors=()):
+    """在限流器控制下发送请求，429/5xx/网络错误时退避重试
+
+    request: 无参协程函数，返回 (结果, 响应头, 实际 token 用量)
+    """
+    name = governor.name
+    for attempt in range(max_retries + 1):
+        queued = time.perf_counter()
+        await governor.acquire(cost)
+        start = time.perf_counter()
+        registry.observe("epub_queue_wait_seconds", start - queued, translator=name)
+        try:
+            result, headers, used_tokens = await request()
+        except asyncio.CancelledError:
+            await governor.release(ok=False, cost=cost)
+            registry.inc("epub_requests_total", translator=name, outcome="cancelled")
+            raise
+        except Exception as e:
+            registry.observe("epub_request_seconds", time.perf_counter() - start, translator=name)
+            status = getattr(e, "status_code", None)
+            headers = getattr(getattr(e, "response", None), "headers", None)
+            retryable = _is_retryable(e, transient_errors)
+            await governor.release(
+                ok=False,
+                throttled=status == 429 or (status is not None and status >= 500),
+                headers=headers,
+                cost=cost,
+            )
+            outcome = "throttled" if status == 429 else "error"
+            registry.inc("epub_requests_total", translator=name, outcome=outcome)
+            if not retryable or attempt >= max_retries:
+                raise
+            registry.inc("epub_retries_total", translator=name)
+            logger.warning(f"[{governor.name}] 请求失败({status or type(e).__name__})，第 {attempt + 1} 次重试")
+            if status != 429:
+                # 429 已由限流器按 Retry-After 暂停，其余错误做指数退避
+                await asyncio.sleep(min(2**attempt, 30))
+            continue
+
+        elapsed = time.perf_counter() - start
+        registry.observe("epub_request_seconds", elapsed, translator=name)
+        registry.inc("epub_requests_total", translator=name, outcome="ok")
+        timer = _request_timer.get()
+        if timer is not None and timer.seconds is None:
+            timer.seconds = elapsed
+        await governor.release(ok=True, headers=headers, cost=cost, used_tokens=used_tokens)
+        return result